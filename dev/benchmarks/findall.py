@@ -9,6 +9,8 @@ REPO = os.path.dirname(os.path.dirname(DIR))
 
 sys.path.insert(0, REPO)
 
+from rednotebook.data import Month
+
 N = 2500
 TEXTS = [
     "aa " * N,
@@ -23,3 +25,33 @@ ITERATIONS = 10**0
 for text in TEXTS:
     timer = timeit.Timer('HASHTAG.findall(text)', setup='from rednotebook.data import HASHTAG; text = "{text}"'.format(**locals()))
     print text[:10], timer.timeit(ITERATIONS)
+
+
+# Extract the tags of a whole journal a few times, like searching, building
+# the cloud and exporting do one after another.
+YEARS = 10
+PASSES = 5
+DAY_TEXT = u'Went to the #gym and met #friends at the #cafe. ' * 20
+
+days = []
+for year in range(2000, 2000 + YEARS):
+    for month_number in range(1, 13):
+        month = Month(year, month_number)
+        for day_number in range(1, 29):
+            day = month.get_day(day_number)
+            day.text = DAY_TEXT
+            days.append(day)
+
+
+def extract_tags(invalidate):
+    for _ in range(PASSES):
+        for day in days:
+            if invalidate:
+                day._invalidate()
+            day.categories
+
+
+print
+print 'Journal with %d days, %d passes' % (len(days), PASSES)
+print 'uncached', timeit.timeit(lambda: extract_tags(True), number=1)
+print 'cached  ', timeit.timeit(lambda: extract_tags(False), number=1)
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Compare the memory used per day by the current Day and Month classes with
+the previous layout that stored a __dict__ and a datetime.date per day.
+
+The current days are measured twice: as loaded from disk and after
+searching and computing the clouds, which cache the words, the folded
+text and the folded category pairs of each day.
+"""
+
+import datetime
+import os.path
+import sys
+
+DIR = os.path.dirname(os.path.abspath(__file__))
+REPO = os.path.dirname(os.path.dirname(DIR))
+
+sys.path.insert(0, REPO)
+
+from rednotebook.data import Month
+
+DAYS = 20000
+TEXT = 'Went for a walk in the park and met #friends for coffee.'
+
+
+class OldDay(object):
+    def __init__(self, month, day_number, day_content):
+        self.month = month
+        self.date = datetime.date(month.year_number, month.month_number, day_number)
+        self.content = day_content
+        self.last_edit_pos = None
+        self.last_preview_pos = None
+
+
+class OldMonth(object):
+    def __init__(self, year_number, month_number, month_content):
+        self.year_number = year_number
+        self.month_number = month_number
+        self.days = dict(
+            (day_number, OldDay(self, day_number, day_content))
+            for day_number, day_content in month_content.items())
+        self.edited = False
+        self.mtime = 0
+
+
+def get_size(obj, seen):
+    """Return the size of obj and all objects reachable from it."""
+    if id(obj) in seen or isinstance(obj, type):
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(get_size(key, seen) + get_size(value, seen) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set)):
+        size += sum(get_size(item, seen) for item in obj)
+    if hasattr(obj, '__dict__'):
+        size += get_size(obj.__dict__, seen)
+    for cls in type(obj).__mro__:
+        for slot in getattr(cls, '__slots__', ()):
+            size += get_size(getattr(obj, slot, None), seen)
+    return size
+
+
+def get_months(month_class):
+    months = []
+    date = datetime.date(1990, 1, 1)
+    while len(months) * 28 < DAYS:
+        content = dict((day, {'text': TEXT}) for day in range(1, 29))
+        months.append(month_class(date.year, date.month, content))
+        date = (date + datetime.timedelta(days=31)).replace(day=1)
+    return months
+
+
+def fill_caches(day):
+    day.get_words()
+    day.folded_text
+    day._get_folded_category_content_pairs()
+
+
+for name, month_class, use_day in [('before', OldMonth, None),
+                                   ('after', Month, None),
+                                   ('after, with caches', Month, fill_caches)]:
+    months = get_months(month_class)
+    # Sorting the days accesses all dates.
+    for month in months:
+        for day in month.days.values():
+            day.date
+            if use_day:
+                use_day(day)
+    days = sum(len(month.days) for month in months)
+    size = get_size(months, set())
+    print name, days, 'days,', size // days, 'bytes per day'
@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os.path
+import random
+import sys
+import timeit
+
+DIR = os.path.dirname(os.path.abspath(__file__))
+REPO = os.path.dirname(os.path.dirname(DIR))
+
+sys.path.insert(0, REPO)
+
+from rednotebook import data
+
+DAYS = 10 * 365
+WORDS_PER_DAY = 150
+WORDS = (
+    u'journal today morning evening work lunch friend #family walk rain '
+    u'book read (coffee) meeting train, garden. 今日は 東京都 天気 散歩').split()
+ITERATIONS = 3
+
+
+def get_texts():
+    rng = random.Random(0)
+    return [u' '.join(rng.choice(WORDS) for _ in range(WORDS_PER_DAY))
+            for _ in range(DAYS)]
+
+
+def split_all(tokenizer, texts):
+    for text in texts:
+        tokenizer.split(text)
+
+
+texts = get_texts()
+for name, tokenizer_class in sorted(data.TOKENIZERS.items()):
+    if not tokenizer_class.is_available():
+        print name, 'not available'
+        continue
+    tokenizer = tokenizer_class()
+    timer = timeit.Timer(lambda: split_all(tokenizer, texts))
+    print name, min(timer.repeat(ITERATIONS, 1))
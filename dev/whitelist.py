@@ -16,6 +16,9 @@ sys.stderr
 from rednotebook.backup import Archiver
 Archiver.check_last_backup_date
 
+import threading
+threading.Thread().daemon
+
 import gtk
 cell = gtk.CellRendererText()
 cell.props.wrap_mode
@@ -24,6 +24,8 @@ import zipfile
 
 import gtk
 
+from rednotebook import storage
+
 
 DATE_FORMAT = '%Y-%m-%d'
 MAX_BACKUP_AGE = 30
@@ -86,6 +88,9 @@ class Archiver(object):
         archive_files = []
         for root, dirs, files in os.walk(data_dir):
             for file in files:
+                # The cache and the search index can be rebuilt from the month files.
+                if file.startswith((storage.CACHE_FILENAME, storage.INDEX_FILENAME)):
+                    continue
                 if not file.endswith('~') and 'RedNotebook-Backup' not in file:
                     archive_files.append(os.path.join(root, file))
 
@@ -50,6 +50,24 @@ class Config(dict):
         'mainFrameY': None,
         'leftDividerPosition': 250,
         'rightDividerPosition': None,
+        # Number of processes for parsing month files (0: one per CPU).
+        'loadWorkers': 0,
+        # "safe": sync saved files to disk, "fast": skip syncing (saves battery).
+        'saveDurability': 'safe',
+        # Word splitting for clouds and statistics (see data.TOKENIZERS).
+        # Leave empty to use MeCab if it is installed.
+        'tokenizer': '',
+        # Store the search index in the journal directory to avoid
+        # reindexing all days on every start.
+        'searchIndexFile': 1,
+        # Only show the most relevant search results (0 shows all).
+        'searchResultLimit': 1000,
+        # Also find words with typos and words with different diacritics.
+        'searchFuzzy': 0,
+        'searchIgnoreAccents': 0,
+        # Show the words and tags of the last "week", "month" or "year", of
+        # a date range like "2015-01-01..2015-06-30" or of "all" days.
+        'cloudPeriod': 'all',
     }
 
     obsolete_keys = set([
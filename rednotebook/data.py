@@ -20,15 +20,23 @@
 from __future__ import division
 
 import datetime
+import logging
 import re
+import threading
+import unicodedata
+
+from rednotebook.util import dates
+
 try:
     import MeCab
 except ImportError:
-    logging.error('MeCab could not be imported.')
-
+    logging.info('MeCab not found. Words will be split at whitespace.')
+    MeCab = None
 
 
 TEXT_RESULT_LENGTH = 42
+# Only create this many snippets for the matches in a day's text.
+MAX_SNIPPETS = 10
 
 ALPHA = r'[^\W\d_]'
 ALPHA_NUMERIC = r'\w'
@@ -45,6 +53,56 @@ def escape_tag(tag):
     return tag.lower().replace(' ', '_')
 
 
+# Full case foldings (see CaseFolding.txt) that lower() doesn't perform.
+# Most of them turn one character into several.
+SPECIAL_FOLDINGS = {
+    u'\u00df': u'ss', u'\u0149': u'\u02bcn', u'\u01f0': u'j\u030c',
+    u'\u0390': u'\u03b9\u0308\u0301', u'\u03b0': u'\u03c5\u0308\u0301', u'\u03c2': u'\u03c3',
+    u'\u0587': u'\u0565\u0582', u'\u1e96': u'h\u0331', u'\u1e97': u't\u0308', u'\u1e98': u'w\u030a',
+    u'\u1e99': u'y\u030a', u'\u1e9a': u'a\u02be', u'\ufb00': u'ff', u'\ufb01': u'fi', u'\ufb02': u'fl',
+    u'\ufb03': u'ffi', u'\ufb04': u'ffl', u'\ufb05': u'st', u'\ufb06': u'st',
+}
+SPECIAL_FOLDING = re.compile(u'[%s]' % u''.join(SPECIAL_FOLDINGS), flags=re.U)
+
+
+def casefold(text):
+    '''Fold the case of the text for case-insensitive comparisons.'''
+    text = text.lower()
+    if SPECIAL_FOLDING.search(text):
+        text = SPECIAL_FOLDING.sub(lambda match: SPECIAL_FOLDINGS[match.group()], text)
+    return text
+
+
+def casefold_with_offsets(text):
+    '''
+    Return the folded text and a list mapping each position in the folded
+    text to the position in the original text. The list is None if the
+    positions are the same.
+    '''
+    # lower() never changes the length of unicode strings in Python 2.
+    lowered = text.lower()
+    if not SPECIAL_FOLDING.search(lowered):
+        return lowered, None
+    parts = []
+    offsets = []
+    for pos, char in enumerate(lowered):
+        folded = SPECIAL_FOLDINGS.get(char, char)
+        parts.append(folded)
+        offsets.extend([pos] * len(folded))
+    return u''.join(parts), offsets
+
+
+def strip_accents(text):
+    '''Remove diacritics, e.g. turn "café" into "cafe".'''
+    decomposed = unicodedata.normalize('NFKD', unicode(text))
+    return u''.join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def compile_search_pattern(text):
+    '''Return a pattern that finds the text in case-folded texts.'''
+    return re.compile(re.escape(casefold(text)), flags=re.U)
+
+
 def get_text_with_dots(text, start, end, found_text=None):
     '''
     Find the outermost spaces and innermost newlines around
@@ -90,13 +148,216 @@ def get_text_with_dots(text, start, end, found_text=None):
     return res
 
 
+class Tokenizer(object):
+    '''
+    Base class for splitting texts into words.
+
+    Subclasses are registered in TOKENIZERS under their name.
+    '''
+    name = None
+
+    @classmethod
+    def is_available(cls):
+        return True
+
+    def split(self, text):
+        raise NotImplementedError
+
+
+class WhitespaceTokenizer(Tokenizer):
+    '''Split the text at whitespace.'''
+    name = 'whitespace'
+
+    def split(self, text):
+        return text.split()
+
+
+class RegexTokenizer(Tokenizer):
+    '''Find all sequences of Unicode word characters.'''
+    name = 'regex'
+    WORD = re.compile(r"\w+(?:'\w+)*", flags=re.U)
+
+    def split(self, text):
+        return self.WORD.findall(text)
+
+
+class MeCabTokenizer(Tokenizer):
+    '''
+    Only keep the nouns found by MeCab. This also works for languages like
+    Japanese that don't separate words by spaces.
+
+    Creating a MeCab tagger loads its dictionaries, so we only create one
+    tagger when it is first needed. A tagger must not be used by multiple
+    threads at once, so we guard it with a lock.
+    '''
+    name = 'mecab'
+
+    def __init__(self):
+        self._tagger = None
+        self._failed = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def is_available(cls):
+        return MeCab is not None
+
+    def _get_tagger(self):
+        if self._tagger is None and not self._failed:
+            try:
+                self._tagger = MeCab.Tagger('-ochasen')
+            except RuntimeError as err:
+                logging.error('MeCab tagger could not be created: %s' % err)
+                self._failed = True
+        return self._tagger
+
+    def _split_nouns(self, tagger, text):
+        nouns = []
+        # The last line is "EOS".
+        for chunk in tagger.parse(text.encode('utf-8')).splitlines()[:-1]:
+            if '\t' not in chunk:
+                chunk += '\t'
+            surface, feature = chunk.split('\t', 1)
+            if feature.startswith('名詞'):
+                nouns.append(surface.decode('utf-8'))
+        return nouns
+
+    def split(self, text):
+        if not self._failed:
+            with self._lock:
+                tagger = self._get_tagger()
+                if tagger is not None:
+                    return self._split_nouns(tagger, text)
+        return text.split()
+
+
+class BigramTokenizer(Tokenizer):
+    '''
+    Split the text at whitespace and turn runs of CJK characters into
+    overlapping bigrams, e.g. "東京都" -> "東京", "京都". This is a simple
+    fallback for texts without spaces if MeCab is not installed.
+    '''
+    name = 'cjk-bigram'
+    CJK = u'\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af'
+    TOKEN = re.compile(u'([%(CJK)s]+)|[^\\s%(CJK)s]+' % locals(), flags=re.U)
+
+    def split(self, text):
+        words = []
+        for match in self.TOKEN.finditer(text):
+            run = match.group(1)
+            if not run:
+                words.append(match.group())
+            elif len(run) == 1:
+                words.append(run)
+            else:
+                words.extend(run[i:i + 2] for i in range(len(run) - 1))
+        return words
+
+
+TOKENIZERS = {}
+
+
+def register_tokenizer(tokenizer_class):
+    TOKENIZERS[tokenizer_class.name] = tokenizer_class
+
+
+for _tokenizer_class in [WhitespaceTokenizer, RegexTokenizer, MeCabTokenizer, BigramTokenizer]:
+    register_tokenizer(_tokenizer_class)
+
+# All days share a single tokenizer.
+_tokenizer = None
+
+
+def get_tokenizer():
+    if _tokenizer is None:
+        set_tokenizer()
+    return _tokenizer
+
+
+def set_tokenizer(name=None):
+    '''
+    Use the tokenizer registered under name. Without a name, use MeCab if
+    it is installed and split at whitespace otherwise.
+    '''
+    global _tokenizer
+    default = 'mecab' if MeCabTokenizer.is_available() else 'whitespace'
+    name = name or default
+    if name not in TOKENIZERS or not TOKENIZERS[name].is_available():
+        logging.warning('Tokenizer "%s" is not available, using "%s"' % (name, default))
+        name = default
+    logging.info('Using tokenizer "%s"' % name)
+    _tokenizer = TOKENIZERS[name]()
+
+
+def contains_text(text, date_string, folded_text, folded_pairs):
+    '''
+    Return True if the text occurs in the date, the case-folded text or
+    one of the (category, folded category, folded entries) tuples of a day.
+    '''
+    folded = casefold(text)
+    return (text in date_string or folded in folded_text or
+            any(folded in category or any(folded in entry for entry in entries)
+                for _category, category, entries in folded_pairs))
+
+
+def has_tag_entry(tag, folded_entry, folded_pairs):
+    '''
+    Return True if a category whose escaped name is tag has an entry that
+    contains the case-folded entry (see contains_text for folded_pairs).
+    '''
+    return any(escape_tag(category) == tag and any(folded_entry in entry for entry in entries)
+               for category, _folded_category, entries in folded_pairs)
+
+
+class DaySnapshot(object):
+    '''
+    Read-only copy of the searchable parts of a day.
+
+    Search results are ranked in a worker thread while the main thread may
+    edit the days and reset their caches, so the worker only sees
+    snapshots that are created in the main thread.
+    '''
+    __slots__ = ('date', 'date_string', 'folded_text', '_pairs', '_folded_pairs')
+
+    def __init__(self, day):
+        self.date = day.date
+        self.date_string = str(day)
+        self.folded_text = day.folded_text
+        self._pairs = dict((category, tuple(entries))
+                           for category, entries in day.get_category_content_pairs().items())
+        self._folded_pairs = tuple(
+            (category, folded_category, tuple(entries))
+            for category, folded_category, entries in day._get_folded_pairs())
+
+    @property
+    def categories(self):
+        return self._pairs.keys()
+
+    def get_category_content_pairs(self):
+        return dict((category, list(entries)) for category, entries in self._pairs.items())
+
+    def contains(self, text):
+        return contains_text(text, self.date_string, self.folded_text, self._folded_pairs)
+
+    def has_tag_entry(self, tag, folded_entry):
+        return has_tag_entry(tag, folded_entry, self._folded_pairs)
+
+
 class Day(object):
+    # Journals can have tens of thousands of days, so avoid a __dict__ per day.
+    __slots__ = ('month', 'day_number', '_date', '_content', '_words', '_hashtags',
+                 '_category_pairs', '_folded', '_folded_pairs', 'edited', 'last_edit_pos',
+                 'last_preview_pos')
+
     def __init__(self, month, day_number, day_content=None):
         day_content = day_content or {'text': u''}
         assert 'text' in day_content, day_content
 
+        if not 1 <= day_number <= dates.get_number_of_days(month.year_number, month.month_number):
+            raise ValueError('day is out of range for month')
         self.month = month
-        self.date = datetime.date(month.year_number, month.month_number, day_number)
+        self.day_number = day_number
+        # The date object is only created when it is needed.
+        self._date = None
 
         # Turn all entries of old "Tags" categories into tags without entries.
         # Apparently, "Tags" may map to None, so explicitly convert to dict.
@@ -107,20 +368,72 @@ class Day(object):
 
         self.content = day_content
 
+        # Has the day changed since it was last written to the change log?
+        self.edited = False
+
         # Remember the last edit and preview position
         self.last_edit_pos = None
         self.last_preview_pos = None
-        if MeCab is not None:
-            self.tagger = MeCab.Tagger('-ochasen')
+
+    @property
+    def date(self):
+        if self._date is None:
+            self._date = datetime.date(
+                self.month.year_number, self.month.month_number, self.day_number)
+        return self._date
+
+    def _get_content(self):
+        return self._content
+
+    def _set_content(self, content):
+        self._content = content
+        self._invalidate()
+    content = property(_get_content, _set_content)
 
     def _get_text(self):
-        '''Return the day's text as unicode.'''
-        return self.content['text'].decode('utf-8')
+        '''
+        Return the day's text as unicode.
+
+        Texts read from disk may be UTF-8 encoded byte strings. We only
+        decode them when they are needed for the first time.
+        '''
+        text = self.content['text']
+        if isinstance(text, str):
+            text = text.decode('utf-8')
+            self.content['text'] = text
+        return text
 
     def _set_text(self, text):
         self.content['text'] = text
+        self._invalidate()
     text = property(_get_text, _set_text)
 
+    def _invalidate(self):
+        '''Forget all values computed from the content.'''
+        self._words = None
+        self._hashtags = None
+        self._category_pairs = None
+        self._folded = None
+        self._folded_pairs = None
+
+    def _get_folded_text(self):
+        '''Return the case-folded text and its offsets (see casefold_with_offsets).'''
+        if self._folded is None:
+            self._folded = casefold_with_offsets(self.text)
+        return self._folded
+
+    @property
+    def folded_text(self):
+        return self._get_folded_text()[0]
+
+    def _get_folded_category_content_pairs(self):
+        '''Return (category, folded category, [(entry, folded entry)]) tuples.'''
+        if self._folded_pairs is None:
+            self._folded_pairs = [
+                (category, casefold(category), [(entry, casefold(entry)) for entry in entries])
+                for category, entries in self._get_category_content_pairs().items()]
+        return self._folded_pairs
+
     @property
     def has_text(self):
         # TODO: Don't strip.
@@ -135,6 +448,16 @@ class Day(object):
             self.content[category][entry] = None
         else:
             self.content[category] = {entry: None}
+        self._invalidate()
+
+    def copy(self):
+        '''
+        Return a day with a copy of the content, which can be read in
+        another thread while this day is edited.
+        '''
+        content = dict((key, dict(value) if isinstance(value, dict) else value)
+                       for key, value in self.content.items())
+        return Day(self.month, self.day_number, content)
 
     def merge(self, same_day):
         assert self.date == same_day.date
@@ -159,11 +482,13 @@ class Day(object):
     @property
     def hashtags(self):
         # The same tag can occur multiple times.
-        return [hashtag.lower() for _, _hash, hashtag in HASHTAG.findall(self.text)]
+        if self._hashtags is None:
+            self._hashtags = [hashtag.lower() for _, _hash, hashtag in HASHTAG.findall(self.text)]
+        return self._hashtags[:]
 
     @property
     def categories(self):
-        return self.get_category_content_pairs().keys()
+        return self._get_category_content_pairs().keys()
 
     def get_entries(self, category):
         return sorted((self.content.get(category) or {}).keys())
@@ -172,6 +497,13 @@ class Day(object):
         '''
         Returns a dict of (category: content_in_category_as_list) pairs.
         '''
+        return dict((category, list(entries))
+                    for category, entries in self._get_category_content_pairs().items())
+
+    def _get_category_content_pairs(self):
+        '''The pairs are cached until the content changes.'''
+        if self._category_pairs is not None:
+            return self._category_pairs
         pairs = {}
         for category, content in self.content.iteritems():
             if category == 'text':
@@ -183,34 +515,29 @@ class Day(object):
         # Include hashtags
         for tag in self.hashtags:
             pairs[tag] = []
+        self._category_pairs = pairs
         return pairs
 
     def get_words(self, with_special_chars=False):
-        def japanese_text_split(text):
-            keywords = []
-            for chunk in self.tagger.parse(str(text)).splitlines()[:-1]:
-                if '\t' not in chunk:
-                    chunk += '\t'
-                (surface, feature) = chunk.split('\t')
-                if feature.startswith('名詞'):
-                    keywords.append(surface)
-            return keywords
-        
-        all_text = self.text
-        for category, content in self.get_category_content_pairs().items():
-            all_text += ' ' + ' '.join([category] + content)
-
-        if self.tagger is None:
-            words = all_text.split()
-        else:
-            words = japanese_text_split(all_text)
-        
-        if with_special_chars:
-            return words
+        '''
+        Return the words of the text and the categories. The words are
+        cached until the content or the tokenizer changes.
+        '''
+        tokenizer = get_tokenizer()
+        if self._words is None or self._words[0] is not tokenizer:
+            all_text = self.text
+            for category, content in self._get_category_content_pairs().items():
+                all_text += ' ' + ' '.join([category] + content)
+
+            words = tokenizer.split(all_text)
+            # Strip all ASCII punctuation except for $, %, @ and '.
+            stripped_words = [w.strip(u'.|-!"&/()=?*+~#_:;,<>^°`{}[]\\') for w in words]
+            stripped_words = [word for word in stripped_words if word]
+            self._words = (tokenizer, words, stripped_words)
 
-        # Strip all ASCII punctuation except for $, %, @ and '.
-        words = [w.strip(u'.|-!"&/()=?*+~#_:;,<>^°`{}[]\\') for w in words]
-        return [word for word in words if word]
+        if with_special_chars:
+            return self._words[1]
+        return self._words[2]
 
     def get_number_of_words(self):
         return len(self.get_words(with_special_chars=True))
@@ -225,7 +552,7 @@ class Day(object):
         if not text:
             # Only add text result once for all tags.
             add_text_to_results = False
-            for day_tag, entries in self.get_category_content_pairs().items():
+            for day_tag, entries in self._get_category_content_pairs().items():
                 for tag in tags:
                     # We know that all tags are present, but we loop through
                     # day_tags nonetheless, to escape the day_tags.
@@ -247,53 +574,108 @@ class Day(object):
             results.extend(self.search_in_categories(text))
         return str(self), results
 
-    def search_in_text(self, search_text):
-        occurence = self.text.upper().find(search_text.upper())
-        print(occurence)
+    def _get_folded_pairs(self):
+        '''Return (category, folded category, [folded entry]) tuples.'''
+        return [(category, folded_category, [folded_entry for _entry, folded_entry in entries])
+                for category, folded_category, entries in self._get_folded_category_content_pairs()]
 
-        # Check if search_text is in text
-        if occurence < 0:
+    def contains(self, text):
+        return contains_text(text, str(self), self.folded_text, self._get_folded_pairs())
+
+    def has_tag_entry(self, tag, folded_entry):
+        '''
+        Return True if a category whose escaped name is tag has an entry
+        that contains the case-folded entry.
+        '''
+        return has_tag_entry(tag, folded_entry, self._get_folded_pairs())
+
+    def search_in_text(self, search_text):
+        if not search_text:
             return None
+        count, snippets = self.find_in_text(compile_search_pattern(search_text), max_snippets=1)
+        return snippets[0] if count else None
 
-        found_text = self.text[occurence:occurence + len(search_text)]
-        result_text = get_text_with_dots(
-            self.text, occurence, occurence + len(search_text), found_text)
-        return result_text
+    def find_in_text(self, pattern, max_snippets=MAX_SNIPPETS):
+        '''
+        Return the number of matches of a pattern from compile_search_pattern()
+        and the snippets of the first max_snippets matches.
+        '''
+        folded_text, offsets = self._get_folded_text()
+        count = 0
+        snippets = []
+        for match in pattern.finditer(folded_text):
+            count += 1
+            if len(snippets) >= max_snippets:
+                continue
+            start, end = match.span()
+            if offsets:
+                # Map the positions back to the original text.
+                start, end = offsets[start], offsets[end - 1] + 1
+            snippets.append(get_text_with_dots(self.text, start, end, self.text[start:end]))
+        return count, snippets
 
     def search_in_categories(self, text):
+        text = casefold(text)
         results = []
-        for category, content in self.get_category_content_pairs().items():
-            if content:
-                if text.upper() in category.upper():
-                    results.extend(content)
+        for category, folded_category, entries in self._get_folded_category_content_pairs():
+            if entries:
+                if text in folded_category:
+                    results.extend(entry for entry, _folded_entry in entries)
                 else:
                     results.extend(
-                        entry for entry in content
-                        if text.upper() in entry.upper())
-            elif text.upper() in category.upper():
+                        entry for entry, folded_entry in entries
+                        if text in folded_entry)
+            elif text in folded_category:
                 results.append(category)
         return results
 
     def __str__(self):
-        return self.date.strftime('%Y-%m-%d')
+        return '%04d-%02d-%02d' % (
+            self.month.year_number, self.month.month_number, self.day_number)
 
     def __cmp__(self, other):
         return cmp(self.date, other.date)
 
 
 class Month(object):
+    __slots__ = ('year_number', 'month_number', '_days', 'edited', 'mtime')
+
     def __init__(self, year_number, month_number, month_content=None, mtime=0):
         self.year_number = year_number
         self.month_number = month_number
 
-        month_content = month_content or {}
-        self.days = {}
-        for day_number, day_content in month_content.iteritems():
-            self.days[day_number] = Day(self, day_number, day_content)
+        self._days = self._create_days(month_content or {})
 
         self.edited = False
         self.mtime = mtime
 
+    def _create_days(self, month_content):
+        days = {}
+        for day_number, day_content in month_content.iteritems():
+            days[day_number] = Day(self, day_number, day_content)
+        return days
+
+    def _read_content(self):
+        '''
+        Return the content of a month that has not been loaded yet.
+
+        Only lazily loaded months (see storage.LazyMonth) start unloaded.
+        '''
+        return {}
+
+    @property
+    def loaded(self):
+        return self._days is not None
+
+    def load(self):
+        if self._days is None:
+            self._days = self._create_days(self._read_content() or {})
+
+    @property
+    def days(self):
+        self.load()
+        return self._days
+
     def get_day(self, day_number):
         if day_number not in self.days:
             self.days[day_number] = Day(self, day_number)
@@ -19,19 +19,17 @@
 
 from __future__ import division
 
-from collections import defaultdict
-import locale
 import logging
-import re
+import threading
 
 import gtk
 import gobject
 
 from rednotebook.gui.browser import HtmlView
-from rednotebook import data
-
-
-CLOUD_WORDS = 30
+from rednotebook.index import sum_counts
+from rednotebook.util.wordcloud import (
+    WordFilter, cmp_words, get_date_range, get_tag_counts, get_tags_for_cloud,
+    get_words_for_cloud)
 
 CLOUD_CSS = """\
 <style type="text/css">
@@ -51,14 +49,6 @@ CLOUD_CSS = """\
 """
 
 
-def get_regex(word):
-    try:
-        return re.compile(word + '$', re.I)
-    except Exception:
-        logging.warning('"%s" is not a valid regular expression' % word)
-        return re.compile('^$')
-
-
 class Cloud(HtmlView):
     def __init__(self, journal):
         HtmlView.__init__(self)
@@ -72,6 +62,8 @@ class Cloud(HtmlView):
         self.webview.connect('navigation-requested', self.on_navigate)
 
         self.last_hovered_word = None
+        self.update_id = 0
+        self.link_dict = []
 
     def update_lists(self):
         config = self.journal.config
@@ -86,13 +78,10 @@ class Cloud(HtmlView):
         self.include_list = [word.lower() for word in self.include_list]
         logging.info('Cloud include list: %s' % self.include_list)
 
-        self.update_regexes()
+        self.update_filter()
 
-    def update_regexes(self):
-        logging.debug('Start compiling regexes')
-        self.regexes_ignore = [get_regex(word) for word in self.ignore_list]
-        self.regexes_include = [get_regex(word) for word in self.include_list]
-        logging.debug('Finished')
+    def update_filter(self):
+        self.word_filter = WordFilter(self.ignore_list, self.include_list)
 
     def update(self, force_update=False):
         """Public method that calls the private "_update"."""
@@ -105,40 +94,63 @@ class Cloud(HtmlView):
 
         gobject.idle_add(self._update)
 
-    def get_categories_counter(self):
-        counter = defaultdict(int)
-        for day in self.journal.days:
-            for cat in day.categories:
-                counter[u'#%s' % data.escape_tag(cat)] += 1
-        return counter
-
     def _update(self):
         logging.debug('Update the cloud')
-        self.journal.save_old_day()
-
-        def cmp_words((word1, _freq1), (word2, _freq2)):
-            # TODO: Use key=locale.strxfrm in python3
-            return locale.strcoll(word1, word2)
-
-        # TODO: Avoid using an instance variable here.
-        self.link_index = 0
+        # Results of older updates are discarded.
+        self.update_id += 1
+
+        # Get the unchanging month counters of the period in the main thread
+        # and sum them and select and format the words in the background.
+        start_date, end_date = get_date_range(self.journal.config.read('cloudPeriod'))
+        counts = self.journal.get_cloud_counts(start_date, end_date)
+        if counts is None:
+            # The journal updates the cloud when its counters are built.
+            return False
+        tag_parts, word_parts = counts
+        font = self.journal.config.read('previewFont')
+        thread = threading.Thread(
+            target=self._compute_cloud,
+            args=(self.update_id, tag_parts, word_parts, self.word_filter, font),
+            name='Cloud')
+        thread.daemon = True
+        thread.start()
+        return False
 
-        tags_count_dict = self.get_categories_counter().items()
-        self.tags = self._get_tags_for_cloud(tags_count_dict, self.regexes_ignore)
-        self.tags.sort(cmp=cmp_words)
+    def _compute_cloud(self, update_id, tag_parts, word_parts, word_filter, font):
+        """Runs in a worker thread and stops when a new update starts."""
+        def get_current_parts(parts):
+            for part in parts:
+                if update_id != self.update_id:
+                    return
+                yield part
+
+        def get_current_words():
+            for pair in word_counts.iteritems():
+                if update_id != self.update_id:
+                    return
+                yield pair
+
+        tag_counts = get_tag_counts(sum_counts(tag_parts))
+        word_counts = sum_counts(get_current_parts(word_parts))
+        tags = get_tags_for_cloud(tag_counts, word_filter)
+        tags.sort(cmp=cmp_words)
+        words = get_words_for_cloud(get_current_words(), word_filter)
+        if update_id != self.update_id:
+            return
+        words.sort(cmp=cmp_words)
 
-        word_count_dict = self.journal.get_word_count_dict()
-        self.words = self._get_words_for_cloud(
-            word_count_dict, self.regexes_ignore, self.regexes_include)
-        self.words.sort(cmp=cmp_words)
+        html = self.get_clouds(words, tags, font)
+        gobject.idle_add(self._show_cloud, update_id, html, tags + words)
 
-        self.link_dict = self.tags + self.words
-        html = self.get_clouds(self.words, self.tags)
-        self.load_html(html)
-        self.last_hovered_word = None
-        logging.debug('Cloud updated')
+    def _show_cloud(self, update_id, html, link_dict):
+        if update_id == self.update_id:
+            self.link_dict = link_dict
+            self.load_html(html)
+            self.last_hovered_word = None
+            logging.debug('Cloud updated')
+        return False
 
-    def _get_cloud_body(self, cloud_words):
+    def _get_cloud_body(self, cloud_words, first_link_index=0):
         if not cloud_words:
             return ''
         counts = [freq for (word, freq) in cloud_words]
@@ -154,41 +166,20 @@ class Cloud(HtmlView):
 
         html_elements = []
 
-        for word, count in cloud_words:
+        for link_index, (word, count) in enumerate(cloud_words, start=first_link_index):
             font_factor = (count - min_count) / delta_count
             font_size = int(min_font_size + font_factor * font_delta)
 
             # Add some whitespace to separate words
             html_elements.append('<a href="search/%s">'
                                  '<span style="font-size:%spx">%s</span></a>&#160;'
-                                 % (self.link_index, font_size, word))
-            self.link_index += 1
+                                 % (link_index, font_size, word))
         return '\n'.join(html_elements)
 
-    def _get_tags_for_cloud(self, tag_count_dict, ignores):
-        return [(tag, freq) for (tag, freq) in tag_count_dict
-                if not any(pattern.match(tag) for pattern in ignores)]
-
-    def _get_words_for_cloud(self, word_count_dict, ignores, includes):
-        # filter short words
-        words = [(word, freq) for (word, freq) in word_count_dict.items()
-                 if (len(word) > 4 or
-                 any(pattern.match(word) for pattern in includes)) and not
-                 # filter words in ignore_list
-                 any(pattern.match(word) for pattern in ignores)]
-
-        def frequency((word, freq)):
-            return freq
-
-        # only take the longest words. If there are less words than n,
-        # len(words) words are returned
-        words.sort(key=frequency)
-        return words[-CLOUD_WORDS:]
-
-    def get_clouds(self, word_counter, tag_counter):
+    def get_clouds(self, word_counter, tag_counter, font):
+        # Links are numbered like the entries of link_dict.
         tag_cloud = self._get_cloud_body(tag_counter)
-        word_cloud = self._get_cloud_body(word_counter)
-        font = self.journal.config.read('previewFont')
+        word_cloud = self._get_cloud_body(word_counter, len(tag_counter))
         heading = '<h1>&#160;%s</h1>'
         parts = ['<html><head>', CLOUD_CSS % locals(), '</head>', '<body>']
         if tag_cloud:
@@ -266,5 +257,5 @@ class Cloud(HtmlView):
         logging.info('"%s" will be hidden from clouds' % selected_word)
         self.ignore_list.append(selected_word)
         self.journal.config.write_list('cloudIgnoreList', self.ignore_list)
-        self.regexes_ignore.append(get_regex(selected_word))
+        self.update_filter()
         self.update(force_update=True)
@@ -87,6 +87,8 @@ class ImportAssistant(Assistant):
         Assistant.__init__(self, *args, **kwargs)
 
         self.importers = get_importers()
+        for importer in self.importers:
+            importer.workers = self.journal.load_workers
 
         self.set_title(_('Import Assistant'))
 
@@ -166,6 +168,8 @@ class Importer(object):
     DEFAULTPATH = os.path.expanduser('~')
     PATHTYPE = 'DIR'
     EXTENSION = None
+    # Number of processes for parsing files (None: one per CPU).
+    workers = None
 
     @classmethod
     def _check_modules(cls, modules):
@@ -243,7 +247,7 @@ class RedNotebookImporter(Importer):
 
     def get_days(self, dir):
         assert os.path.isdir(dir)
-        months = storage.load_all_months_from_disk(dir)
+        months = storage.load_all_months_from_disk(dir, workers=self.workers)
         for month in sorted(months.values()):
             for day in sorted(month.days.values()):
                 yield day
@@ -408,6 +408,9 @@ class MainWindow(object):
         self.search_tree_view.show()
         scroll = gtk.ScrolledWindow()
         scroll.add(self.search_tree_view)
+        adjustment = scroll.get_vadjustment()
+        adjustment.connect('changed', self.search_tree_view.on_scrolled)
+        adjustment.connect('value-changed', self.search_tree_view.on_scrolled)
         self.builder.get_object('search_container').pack_start(scroll)
         self.search_box = search.SearchComboBox(
             self.builder.get_object('search_box'), self)
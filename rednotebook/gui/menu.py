@@ -205,7 +205,7 @@ class MainMenuBar(object):
                             _("The directory should contain your journal's data files"))
 
     def on_save_button_clicked(self, widget):
-        self.journal.save_to_disk()
+        self.journal.save_to_disk(background=True)
 
     def on_save_as_menu_item_activate(self, widget):
         # widget is None when we call this method after the journal could not be
@@ -168,6 +168,14 @@ class DateFormatOption(ComboBoxOption):
         self.preview.set_text(label_text)
 
 
+class CloudPeriodOption(ComboBoxOption):
+    def __init__(self, text, name):
+        ComboBoxOption.__init__(self, text, name, ['all', 'week', 'month', 'year'])
+        self.set_tooltip_text(_('Show the words and tags of all days, of the last week, '
+                                'month or year or of a date range like 2015-01-01..2015-06-30'))
+        self.combo.set_active_text(unicode(Option.config.read(name, 'all')))
+
+
 class FontOption(Option):
     def __init__(self, text, name):
         Option.__init__(self, text, name, '')
@@ -289,6 +297,16 @@ class OptionsManager(object):
             _('Show right-side tags pane'),
             'showTagsPane'))
 
+        # Search options
+        self.options.append(TickOption(
+            _('Find similar words when searching'),
+            'searchFuzzy',
+            tooltip=_('Also find words with typos, e.g. "recieve" finds "receive"')))
+        self.options.append(TickOption(
+            _('Ignore accents when searching'),
+            'searchIgnoreAccents',
+            tooltip=_('Treat letters with and without diacritics as equal')))
+
         def check_version_action(widget):
             utils.check_new_version(self.main_window.journal, info.version)
             # Apply changes from dialog to options window
@@ -310,6 +328,7 @@ class OptionsManager(object):
                        tooltip=_('Do not show these comma separated words and #tags in the clouds')),
             TextOption(_('Include small words in cloud'), 'cloudIncludeList',
                        tooltip=_('Allow these words with 4 letters or less')),
+            CloudPeriodOption(_('Cloud period'), 'cloudPeriod'),
         ])
 
         self.add_all_options()
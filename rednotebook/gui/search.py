@@ -17,15 +17,24 @@
 # 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 # -----------------------------------------------------------------------
 
+import threading
 from xml.sax.saxutils import escape
 
 import gobject
 import gtk
 
+from rednotebook.data import DaySnapshot
 from rednotebook.gui.customwidgets import CustomComboBoxEntry, CustomListView
+from rednotebook.query import parse_query, rank
 from rednotebook.util import dates
 
 
+# Wait this long after the last keystroke before searching (milliseconds).
+SEARCH_DELAY = 300
+# Number of days whose results are added to the tree view at once.
+RESULTS_PAGE_SIZE = 50
+
+
 class SearchComboBox(CustomComboBoxEntry):
     def __init__(self, combo_box, main_window):
         CustomComboBoxEntry.__init__(self, combo_box)
@@ -36,29 +45,43 @@ class SearchComboBox(CustomComboBoxEntry):
         self.entry.set_icon_from_stock(1, gtk.STOCK_CLEAR)
         self.entry.connect('icon-press', lambda *args: self.set_active_text(''))
 
+        self.pending_search = None
+
         self.entry.connect('changed', self.on_entry_changed)
         self.entry.connect('activate', self.on_entry_activated)
 
     def on_entry_changed(self, entry):
         """Called when the entry changes."""
-        self.search(self.get_active_text())
+        self.cancel_pending_search()
+        search_text = self.get_active_text()
+        if search_text.strip():
+            # Only search when the user stops typing.
+            self.pending_search = gobject.timeout_add(
+                SEARCH_DELAY, self.on_search_delay_elapsed, search_text)
+        else:
+            self.search(search_text)
+
+    def on_search_delay_elapsed(self, search_text):
+        self.pending_search = None
+        self.search(search_text)
+        return False
 
     def on_entry_activated(self, entry):
         """Called when the user hits enter."""
+        self.cancel_pending_search()
         search_text = self.get_active_text()
         self.add_entry(search_text)
         self.search(search_text)
 
-    def search(self, search_text):
-        tags = []
-        queries = []
-        for part in search_text.split():
-            if part.startswith(u'#'):
-                tags.append(part.lstrip(u'#').lower())
-            else:
-                queries.append(part)
+    def cancel_pending_search(self):
+        if self.pending_search is not None:
+            gobject.source_remove(self.pending_search)
+            self.pending_search = None
 
-        search_text = ' '.join(queries)
+    def search(self, search_text):
+        query = parse_query(search_text)
+        texts = query.texts
+        search_text = texts[0] if texts else u''
 
         # Highlight all occurences in the current day's text
         self.main_window.highlight_text(search_text)
@@ -68,7 +91,7 @@ class SearchComboBox(CustomComboBoxEntry):
             gobject.idle_add(self.main_window.day_text_field.scroll_to_text,
                              search_text)
 
-        self.main_window.search_tree_view.update_data(search_text, tags)
+        self.main_window.search_tree_view.update_data(query)
 
 
 class SearchTreeView(CustomListView):
@@ -76,25 +99,82 @@ class SearchTreeView(CustomListView):
         CustomListView.__init__(self, [(_('Date'), str), (_('Text'), str)])
         self.main_window = main_window
         self.journal = self.main_window.journal
-        self.tree_store = self.get_model()
+        # Additional snippets of a day are shown as children of its first snippet.
+        self.tree_store = gtk.TreeStore(str, str)
+        self.set_model(self.tree_store)
+        # Results of older searches are discarded.
+        self.search_id = 0
+        # Ranked days whose results have not been shown yet.
+        self.query = None
+        self.remaining_days = []
 
         self.connect('cursor_changed', self.on_cursor_changed)
 
-    def update_data(self, search_text, tags):
+    def update_data(self, query):
+        self.search_id += 1
         self.tree_store.clear()
+        self.remaining_days = []
 
-        if not tags and not search_text:
+        if query.empty:
             self.main_window.cloud.show()
             self.parent.hide()
             return
         self.main_window.cloud.hide()
         self.parent.show()
 
-        for date_string, entries in self.journal.search(search_text, tags):
-            for entry in entries:
-                entry = escape(entry)
-                entry = entry.replace('STARTBOLD', '<b>').replace('ENDBOLD', '</b>')
-                self.tree_store.append([date_string, entry])
+        # Select the days in the main thread and rank them in the background.
+        # The worker only gets snapshots, because the days may be edited
+        # in the meantime.
+        days = self.journal.get_days_to_search(query)
+        snapshots = [DaySnapshot(day) for day in days]
+        limit = self.journal.config.read('searchResultLimit') or None
+        thread = threading.Thread(
+            target=self._rank_days, args=(self.search_id, query, snapshots, days, limit),
+            name='Search')
+        thread.daemon = True
+        thread.start()
+
+    def _rank_days(self, search_id, query, snapshots, days, limit):
+        """Runs in a worker thread and stops when a new search starts."""
+        def get_current_snapshots():
+            for snapshot in snapshots:
+                if search_id != self.search_id:
+                    return
+                yield snapshot
+        ranked_snapshots = rank(query, get_current_snapshots(), limit)
+        gobject.idle_add(self._show_ranked_days, search_id, query, ranked_snapshots, days)
+
+    def _show_ranked_days(self, search_id, query, ranked_snapshots, days):
+        if search_id == self.search_id:
+            days_by_date = dict((day.date, day) for day in days)
+            self.query = query
+            self.remaining_days = [days_by_date[snapshot.date] for snapshot in ranked_snapshots]
+            self.add_page()
+        return False
+
+    def add_page(self):
+        days = self.remaining_days[:RESULTS_PAGE_SIZE]
+        del self.remaining_days[:RESULTS_PAGE_SIZE]
+        for day in days:
+            date_string, results = self.query.get_results(day)
+            for count, snippets in results:
+                text = self._format_snippet(snippets[0])
+                if count > 1:
+                    text += ' <i>(%s)</i>' % (_('%d matches') % count)
+                parent = self.tree_store.append(None, [date_string, text])
+                for snippet in snippets[1:]:
+                    self.tree_store.append(parent, [date_string, self._format_snippet(snippet)])
+
+    def _format_snippet(self, snippet):
+        snippet = escape(snippet)
+        return snippet.replace('STARTBOLD', '<b>').replace('ENDBOLD', '</b>')
+
+    def on_scrolled(self, adjustment):
+        """Show more results when the end of the list becomes visible."""
+        if not self.remaining_days:
+            return
+        if adjustment.value + 2 * adjustment.page_size >= adjustment.upper:
+            self.add_page()
 
     def on_cursor_changed(self, treeview):
         """Move to the selected day when user clicks on it"""
@@ -0,0 +1,501 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------
+# Copyright (c) 2009  Jendrik Seipp
+#
+# RedNotebook is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# RedNotebook is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with RedNotebook; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+# -----------------------------------------------------------------------
+
+import bisect
+from collections import Counter
+import datetime
+import re
+
+from rednotebook.data import casefold, escape_tag, strip_accents
+from rednotebook.util import dates
+
+
+# Punctuation at the start and end of terms.
+PUNCTUATION = re.compile(r'^\W+|\W+$', flags=re.U)
+
+
+class DayIndex(object):
+    '''
+    All non-empty days of a journal sorted by their date.
+
+    Instead of collecting and sorting all days whenever we need them, the
+    journal calls update() for each day that changes.
+    '''
+    def __init__(self, months):
+        self.days = sorted(
+            day for month in months for day in month.days.values() if not day.empty)
+        self.dates = [day.date for day in self.days]
+
+    def _find(self, date):
+        pos = bisect.bisect_left(self.dates, date)
+        return pos, pos < len(self.dates) and self.dates[pos] == date
+
+    def update(self, day):
+        '''Add, replace or remove the day depending on whether it is empty.'''
+        pos, present = self._find(day.date)
+        if day.empty:
+            if present:
+                del self.dates[pos]
+                del self.days[pos]
+        elif present:
+            self.days[pos] = day
+        else:
+            self.dates.insert(pos, day.date)
+            self.days.insert(pos, day)
+
+    def get_days_in_date_range(self, start_date, end_date):
+        start = bisect.bisect_left(self.dates, start_date)
+        end = bisect.bisect_right(self.dates, end_date)
+        return self.days[start:end]
+
+    def get_day(self, date):
+        pos, present = self._find(date)
+        return self.days[pos] if present else None
+
+
+def normalize(text):
+    '''Searching is case-insensitive.'''
+    return casefold(text)
+
+
+def get_trigrams(term):
+    return set(term[i:i + 3] for i in range(len(term) - 2))
+
+
+def get_word(term):
+    return PUNCTUATION.sub(u'', term)
+
+
+def get_max_typos(word):
+    return 1 if len(word) <= 5 else 2
+
+
+def get_edit_distance(word1, word2, max_distance):
+    '''
+    Return the number of insertions, deletions, substitutions and swaps of
+    adjacent letters that turn word1 into word2 or max_distance + 1 if more
+    edits are needed.
+    '''
+    if abs(len(word1) - len(word2)) > max_distance:
+        return max_distance + 1
+    previous_row = None
+    row = range(len(word2) + 1)
+    for i, char1 in enumerate(word1, start=1):
+        previous_row, row, old_row = row, [i] + [0] * len(word2), previous_row
+        for j, char2 in enumerate(word2, start=1):
+            row[j] = min(previous_row[j] + 1, row[j - 1] + 1,
+                         previous_row[j - 1] + (char1 != char2))
+            if i > 1 and j > 1 and char1 == word2[j - 2] and word1[i - 2] == char2:
+                row[j] = min(row[j], old_row[j - 2] + 1)
+        if min(row) > max_distance:
+            return max_distance + 1
+    return min(row[-1], max_distance + 1)
+
+
+class TextIndex(object):
+    '''
+    Inverted index mapping the normalized terms of all days to their dates.
+
+    The terms of a day are the whitespace-separated parts of its text, its
+    categories and entries and its date. A substring query matches a day
+    only if each whitespace-separated part of the query is contained in
+    one of the day's terms, so the index returns a superset of the days
+    that Query.matches() finds. To find the terms that contain a query part,
+    we use a trigram index over the vocabulary instead of looking at every
+    term.
+
+    The trigram index also finds words that are similar to misspelled query
+    words. Words with diacritics are additionally stored by their version
+    without diacritics, and these versions get their own trigram index to
+    find them by substrings.
+    '''
+    def __init__(self, days=()):
+        self.postings = {}
+        self.day_terms = {}
+        self.trigrams = {}
+        self.accented_words = {}
+        self.plain_trigrams = {}
+        for day in days:
+            self.add(day)
+
+    @staticmethod
+    def get_terms(day):
+        parts = [day.text, str(day)]
+        for category, entries in day.get_category_content_pairs().items():
+            parts.append(category)
+            parts.extend(entries)
+        return frozenset(normalize(u' '.join(parts)).split())
+
+    def add(self, day):
+        self.add_terms(day.date, self.get_terms(day))
+
+    def add_terms(self, date, terms):
+        self.day_terms[date] = terms
+        for term in terms:
+            if term not in self.postings:
+                self.postings[term] = set()
+                for trigram in get_trigrams(term):
+                    self.trigrams.setdefault(trigram, set()).add(term)
+                word = get_word(term)
+                plain_word = strip_accents(word)
+                if plain_word != word:
+                    if plain_word not in self.accented_words:
+                        self.accented_words[plain_word] = {}
+                        for trigram in get_trigrams(plain_word):
+                            self.plain_trigrams.setdefault(trigram, set()).add(plain_word)
+                    self.accented_words[plain_word][term] = word
+            self.postings[term].add(date)
+
+    def remove(self, date):
+        for term in self.day_terms.pop(date, ()):
+            dates = self.postings[term]
+            dates.discard(date)
+            if not dates:
+                del self.postings[term]
+                for trigram in get_trigrams(term):
+                    terms = self.trigrams[trigram]
+                    terms.discard(term)
+                    if not terms:
+                        del self.trigrams[trigram]
+                plain_word = strip_accents(get_word(term))
+                words = self.accented_words.get(plain_word, {})
+                if words.pop(term, None) is not None and not words:
+                    del self.accented_words[plain_word]
+                    for trigram in get_trigrams(plain_word):
+                        plain_words = self.plain_trigrams[trigram]
+                        plain_words.discard(plain_word)
+                        if not plain_words:
+                            del self.plain_trigrams[trigram]
+
+    def update(self, day):
+        self.remove(day.date)
+        if not day.empty:
+            self.add(day)
+
+    def get_terms_containing(self, part):
+        if len(part) < 3:
+            candidates = self.postings
+        else:
+            term_sets = sorted(
+                (self.trigrams.get(trigram, set()) for trigram in get_trigrams(part)), key=len)
+            candidates = term_sets[0].intersection(*term_sets[1:])
+        return [term for term in candidates if part in term]
+
+    def get_similar_words(self, word):
+        '''
+        Return the words in the journal that can be turned into the word
+        with a few typos.
+        '''
+        max_typos = get_max_typos(word)
+        # A typo can change all trigrams of short words, so we also use the
+        # trigrams of the word with one letter removed.
+        trigrams = get_trigrams(word)
+        for pos in range(len(word)):
+            trigrams |= get_trigrams(word[:pos] + word[pos + 1:])
+        candidates = set()
+        for trigram in trigrams:
+            candidates.update(self.trigrams.get(trigram, ()))
+        words = set()
+        for term in candidates:
+            term_word = get_word(term)
+            if get_edit_distance(word, term_word, max_typos) <= max_typos:
+                words.add(term_word)
+        return words
+
+    def get_accented_variants(self, plain_part):
+        '''
+        Return the parts of words with diacritics that turn into plain_part
+        without diacritics, e.g. "café" in "cafés" for "cafe".
+        '''
+        if len(plain_part) < 3:
+            candidates = self.accented_words
+        else:
+            word_sets = sorted(
+                (self.plain_trigrams.get(trigram, set()) for trigram in get_trigrams(plain_part)),
+                key=len)
+            candidates = word_sets[0].intersection(*word_sets[1:])
+        variants = set()
+        for plain_word in candidates:
+            if plain_part not in plain_word:
+                continue
+            for word in self.accented_words[plain_word].values():
+                if len(word) != len(plain_word):
+                    # Some characters decompose into several ones.
+                    variants.add(word)
+                    continue
+                start = plain_word.find(plain_part)
+                while start != -1:
+                    variants.add(word[start:start + len(plain_part)])
+                    start = plain_word.find(plain_part, start + 1)
+        return variants
+
+    def get_variants(self, word, fuzzy=False, ignore_accents=False):
+        '''
+        Return other words in the journal that should be found when
+        searching for the (normalized) word.
+        '''
+        variants = set()
+        if ignore_accents:
+            plain_word = strip_accents(word)
+            variants.add(plain_word)
+            variants.update(self.get_accented_variants(plain_word))
+        if fuzzy and len(word) >= 3:
+            variants.update(self.get_similar_words(word))
+        variants.discard(word)
+        variants.discard(u'')
+        return sorted(variants)
+
+    def find(self, text):
+        '''
+        Return the dates of all days that may contain the text.
+        '''
+        dates = None
+        # Look at the rarest parts first.
+        for part in sorted(normalize(text).split(), key=len, reverse=True):
+            part_dates = set()
+            for term in self.get_terms_containing(part):
+                part_dates |= self.postings[term]
+            dates = part_dates if dates is None else dates & part_dates
+            if not dates:
+                break
+        return dates or set()
+
+
+def _contains(sorted_list, item):
+    pos = bisect.bisect_left(sorted_list, item)
+    return pos < len(sorted_list) and sorted_list[pos] == item
+
+
+def get_full_months(start_date, end_date):
+    '''
+    Return the first and last (year, month) that lie completely in the
+    date range. The first month is later than the last one if there are
+    no such months.
+    '''
+    first = (start_date.year, start_date.month)
+    if start_date.day != 1:
+        first = (first[0] + first[1] // 12, first[1] % 12 + 1)
+    last = (end_date.year, end_date.month)
+    if end_date.day != dates.get_number_of_days(*last):
+        last = (last[0] - (last[1] == 1), (last[1] - 2) % 12 + 1)
+    return first, last
+
+
+class MonthlyCounter(object):
+    '''
+    Counts of items (e.g. words) for the whole journal and for each month.
+
+    The counts of a date range are the sum of the counters of the months
+    that lie completely in the range plus the counts of the remaining days
+    at its borders, so we never have to look at more than two months of
+    days.
+
+    The month counters returned by get_parts() are replaced instead of
+    changed when one of their days changes, so they can be summed in
+    another thread.
+    '''
+    def __init__(self):
+        self.total = Counter()
+        self.months = {}
+        # Keys of the month counters that get_parts() has returned.
+        self.shared = set()
+
+    def update(self, date, diff):
+        '''Add the (possibly negative) counts of a day to its month.'''
+        key = (date.year, date.month)
+        month = self.months.get(key)
+        if month is None or key in self.shared:
+            month = Counter(month or {})
+            self.shared.discard(key)
+        for counter in [self.total, month]:
+            for item, delta in diff.iteritems():
+                if not delta:
+                    continue
+                counter[item] += delta
+                if counter[item] <= 0:
+                    del counter[item]
+        if month:
+            self.months[key] = month
+        else:
+            self.months.pop(key, None)
+
+    def get_parts(self, start_date=None, end_date=None, count_days=None):
+        '''
+        Return a list of counters whose sum are the counts between the
+        dates (see sum_counts). count_days(start, end) returns the counts of
+        the days in a range that covers no full month. Without dates, the
+        list holds the counters of all months.
+        '''
+        if start_date is None and end_date is None:
+            keys = self.months.keys()
+            parts = []
+        else:
+            first, last = get_full_months(start_date, end_date)
+            if first > last:
+                return [count_days(start_date, end_date)]
+            keys = [key for key in self.months if first <= key <= last]
+            parts = [
+                count_days(start_date, datetime.date(first[0], first[1], 1) - dates.one_day),
+                count_days(datetime.date(last[0], last[1], dates.get_number_of_days(*last)) +
+                           dates.one_day, end_date)]
+        self.shared.update(keys)
+        return parts + [self.months[key] for key in keys]
+
+    def get_counts(self, start_date, end_date, count_days):
+        '''Return the counts between the dates (see get_parts).'''
+        return sum_counts(self.get_parts(start_date, end_date, count_days))
+
+
+def sum_counts(counters):
+    total = Counter()
+    for counter in counters:
+        total.update(counter)
+    return total
+
+
+class TagIndex(object):
+    '''
+    Index of the tags of all days.
+
+    Maps each escaped tag to the sorted dates of the days that have it and
+    counts the days that have each tag name per month. For each day we
+    remember its tag names and entries to be able to remove it again.
+    '''
+    def __init__(self, days=()):
+        self.postings = {}
+        self.name_counts = MonthlyCounter()
+        self.day_tags = {}
+        for day in days:
+            self.add(day)
+
+    def add(self, day):
+        names = day.categories
+        if not names:
+            return
+        entries = dict((category, day.get_entries(category))
+                       for category in day.content if category != 'text')
+        self.day_tags[day.date] = (names, entries)
+        self.name_counts.update(day.date, Counter(names))
+        for tag in set(escape_tag(name) for name in names):
+            bisect.insort(self.postings.setdefault(tag, []), day.date)
+
+    def remove(self, date):
+        if date not in self.day_tags:
+            return
+        names, entries = self.day_tags.pop(date)
+        diff = Counter()
+        diff.subtract(names)
+        self.name_counts.update(date, diff)
+        for tag in set(escape_tag(name) for name in names):
+            dates = self.postings[tag]
+            del dates[bisect.bisect_left(dates, date)]
+            if not dates:
+                del self.postings[tag]
+
+    def update(self, day):
+        self.remove(day.date)
+        if not day.empty:
+            self.add(day)
+
+    @property
+    def names(self):
+        '''Map the names of all tags to the number of days that have them.'''
+        return self.name_counts.total
+
+    @property
+    def tags(self):
+        '''Return the names of all tags.'''
+        return self.names.keys()
+
+    def get_name_count_parts(self, day_index, start_date=None, end_date=None):
+        '''
+        Return counters whose sum is the number of days between the dates
+        for each tag name (see MonthlyCounter.get_parts).
+        '''
+        def count_days(start, end):
+            return Counter(
+                name for day in day_index.get_days_in_date_range(start, end)
+                for name in self.day_tags.get(day.date, ((), None))[0])
+        return self.name_counts.get_parts(start_date, end_date, count_days)
+
+    def get_dates(self, tags, start_date=None, end_date=None):
+        '''
+        Return the sorted dates of the days that have all escaped tags and
+        lie in the optional date range.
+        '''
+        postings = sorted((self.postings.get(tag, []) for tag in tags), key=len)
+        if not postings:
+            return []
+        dates = postings[0]
+        if start_date is not None or end_date is not None:
+            start = 0 if start_date is None else bisect.bisect_left(dates, start_date)
+            end = len(dates) if end_date is None else bisect.bisect_right(dates, end_date)
+            dates = dates[start:end]
+        # Look up the dates of the rarest tag in the other posting lists.
+        return [date for date in dates
+                if all(_contains(other_dates, date) for other_dates in postings[1:])]
+
+    def get_entries(self, category):
+        entries = set()
+        for date in self.postings.get(escape_tag(category), []):
+            entries.update(self.day_tags[date][1].get(category, []))
+        return sorted(entries)
+
+
+def get_word_counts(words):
+    return Counter(word.lower() for word in words)
+
+
+class WordCounter(object):
+    '''
+    Number of occurrences of all lowercased words in the journal and in
+    each month.
+
+    The counts are built once. When a day changes, replace() adds the
+    difference between the day's old and new words.
+    '''
+    def __init__(self, days=()):
+        self.monthly_counts = MonthlyCounter()
+        for day in days:
+            self.monthly_counts.update(day.date, get_word_counts(day.get_words()))
+
+    @property
+    def counts(self):
+        return self.monthly_counts.total
+
+    def replace(self, date, old_words, new_words):
+        diff = get_word_counts(new_words)
+        diff.subtract(get_word_counts(old_words))
+        self.monthly_counts.update(date, diff)
+
+    def get_parts(self, day_index, start_date=None, end_date=None):
+        '''
+        Return counters whose sum is the word counts of the days between
+        the dates (see MonthlyCounter.get_parts).
+        '''
+        def count_days(start, end):
+            counts = Counter()
+            for day in day_index.get_days_in_date_range(start, end):
+                counts.update(get_word_counts(day.get_words()))
+            return counts
+        return self.monthly_counts.get_parts(start_date, end_date, count_days)
+
+    def get_counts(self, day_index, start_date, end_date):
+        '''Return the word counts of the days between the dates.'''
+        return sum_counts(self.get_parts(day_index, start_date, end_date))
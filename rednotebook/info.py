@@ -87,6 +87,9 @@ def get_commandline_parser():
     parser.add_argument(
         '--date', dest='start_date',
         help='load specified date (format: YYYY-MM-DD)')
+    parser.add_argument(
+        '--cache', dest='cache_action', choices=['verify', 'rebuild'],
+        help='verify or rebuild the cache of parsed journal files (rebuild also resets the search index)')
     parser.add_argument('journal', nargs='?', help=journal_path_help)
     return parser
 
@@ -273,6 +276,17 @@ On the left you find the search box. Double-clicking on a day in the
 search results lets you jump to it.
 
 You can search for text or dates (e.g. 2014, 2014-01, 2014-01-19).
+All words have to appear in a day. Use quotes to search for a phrase
+("ice cream"), a minus to exclude a word (-rain) and OR to allow
+either word (beach OR lake). Search for #holiday to find days with the
+tag "holiday" and for work:meeting to find days whose "work" tag has an
+entry containing "meeting". Searches can be limited to certain dates
+with in:2014-01, before:2014-01-19 and after:2014.
+
+The results are sorted by relevance: days that contain the searched
+words more often and recent days come first. If a day contains a word
+several times, the number of matches is shown and you can expand the
+result to see more of them.
 
 
 == Clouds ==[clouds]
@@ -292,6 +306,10 @@ escape them with a backslash: 3\\.50\\?
 You can **hide the word cloud** by adding the regular expression .* to
 the blacklist. This will filter out all words.
 
+By default the clouds cover the whole journal. In the Preferences dialog
+you can restrict them to the last week, month or year or to a date range
+like 2015-01-01..2015-06-30.
+
 
 == Spellcheck ==
 
@@ -17,9 +17,8 @@
 # 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 # -----------------------------------------------------------------------
 
-from collections import defaultdict
 import datetime
-import itertools
+import functools
 import locale
 import logging
 import os
@@ -157,7 +156,9 @@ from rednotebook import backup
 
 from rednotebook.util.statistics import Statistics
 from rednotebook.gui.main_window import MainWindow
+from rednotebook import index
 from rednotebook import storage
+from rednotebook.query import Plan
 from rednotebook.data import Month
 
 
@@ -178,6 +179,16 @@ class Journal:
         self.month = None
         self.date = None
         self.months = {}
+        self.month_cache = None
+        self.change_log = None
+        self.day_index = None
+        self.text_index = None
+        self.tag_index = None
+        self.word_counter = None
+        # Dates of the days edited while the counters are built.
+        self.edited_while_counting = None
+        self.search_index_file = None
+        self.stats = None
 
         # The dir name is the title
         self.title = ''
@@ -192,8 +203,13 @@ class Journal:
 
         utils.set_environment_variables(self.config)
 
+        data.set_tokenizer(self.config.read('tokenizer'))
+
         self.actual_date = self.get_start_date()
 
+        # Write the journal files without blocking the main loop.
+        self.writer = storage.JournalWriter(gobject.idle_add)
+
         # Let components check if the MainWindow has been created
         self.frame = None
         self.frame = MainWindow(self)
@@ -215,7 +231,7 @@ class Journal:
             utils.check_new_version(self, info.version, startup=True)
 
         # Automatically save the content after a period of time
-        gobject.timeout_add_seconds(600, self.save_to_disk)
+        gobject.timeout_add_seconds(600, self.autosave)
 
     def get_journal_path(self):
         '''
@@ -284,7 +300,12 @@ class Journal:
         options['font'] = self.config.read('previewFont')
         return markup.convert(text, target, self.dirs.data_dir, headers=headers, options=options)
 
-    def save_to_disk(self, exit_imminent=False, changing_journal=False, saveas=False):
+    def save_to_disk(self, exit_imminent=False, changing_journal=False, saveas=False,
+                     background=False):
+        '''
+        Save all edited months. If background is True, only take snapshots
+        of the months here and write them in the writer thread.
+        '''
         self.save_old_day()
 
         try:
@@ -293,13 +314,83 @@ class Journal:
             self.frame.show_save_error_dialog(exit_imminent)
             return True
 
+        # When saving as, the log belongs to the old journal directory.
+        change_log = None if saveas else self.change_log
+        durable = self.durable_saving
+
+        if background:
+            snapshots = storage.take_snapshots(self.months)
+            if snapshots:
+                self.writer.submit(
+                    self._write_in_background,
+                    (snapshots, self.dirs.data_dir, change_log, durable, self.month_cache,
+                     self.search_index_file, self._get_index_update(snapshots)),
+                    functools.partial(self._on_saved_in_background, snapshots))
+            else:
+                self._on_saved(False)
+            # tell gobject to keep saving the content in regular intervals
+            return True
+
+        # Let the writer thread finish its pending jobs first.
+        self.writer.wait()
         try:
             something_saved = storage.save_months_to_disk(
-                self.months, self.dirs.data_dir, exit_imminent, saveas)
+                self.months, self.dirs.data_dir, exit_imminent, saveas, self.month_cache,
+                change_log, durable)
         except (IOError, OSError):
             self.frame.show_save_error_dialog(exit_imminent)
             something_saved = None
 
+        if something_saved:
+            self._save_search_index()
+            self.writer.wait()
+
+        self._on_saved(something_saved, update_cloud=not (exit_imminent or changing_journal))
+
+        # tell gobject to keep saving the content in regular intervals
+        return True
+
+    def _get_index_update(self, snapshots):
+        '''
+        Return a dictionary mapping the paths of the snapshot months to the
+        terms of their days and the paths of all months or None if the
+        index file is not used.
+        '''
+        if self.text_index is None or self.search_index_file is None:
+            return None
+        index_terms = {}
+        for month, content in snapshots:
+            day_terms = storage.get_day_terms(self.text_index, month)
+            if day_terms is not None:
+                index_terms[storage.get_month_path(self.dirs.data_dir, month)] = day_terms
+        paths = [storage.get_month_path(self.dirs.data_dir, month) for month in self.months.values()]
+        return index_terms, paths
+
+    @staticmethod
+    def _write_in_background(snapshots, data_dir, change_log, durable, month_cache,
+                             index_file, index_update):
+        '''
+        Runs in the writer thread. Write the month files and update the
+        month cache and the search index file on disk.
+        '''
+        written = storage.write_snapshots(snapshots, data_dir, change_log, durable)
+        storage.update_cache(month_cache, written)
+        if index_update is not None:
+            index_terms, paths = index_update
+            entries = [(filename, index_terms[filename], mtime)
+                       for filename, content, mtime in written if filename in index_terms]
+            storage.update_index_file(index_file, entries, paths)
+        return written
+
+    def _on_saved_in_background(self, snapshots, written, error):
+        if error:
+            storage.mark_unsaved(snapshots)
+            self.frame.show_save_error_dialog(False)
+            self._on_saved(None)
+        else:
+            self._on_saved(bool(written))
+
+    def _on_saved(self, something_saved, update_cloud=True):
         if something_saved:
             self.show_message(_('The content has been saved to %s') % self.dirs.data_dir, error=False)
             logging.info('The content has been saved to %r' % self.dirs.data_dir)
@@ -311,13 +402,69 @@ class Journal:
 
         self.config.save_to_disk()
 
-        if not (exit_imminent or changing_journal) and something_saved:
+        if update_cloud and something_saved:
             # Update cloud
             self.frame.cloud.update(force_update=True)
 
+    @property
+    def load_workers(self):
+        '''Number of processes for parsing month files (None: one per CPU).'''
+        return self.config.read('loadWorkers') or None
+
+    @property
+    def durable_saving(self):
+        return self.config.read('saveDurability') != 'fast'
+
+    def autosave(self):
+        '''
+        Append the days edited since the last save to the change log
+        instead of rewriting their month files.
+        '''
+        if self.change_log.size > storage.MAX_LOG_SIZE:
+            # Compact the log into the month files.
+            return self.save_to_disk(background=True)
+
+        self._log_edits()
+
+        self.config.save_to_disk()
+
         # tell gobject to keep saving the content in regular intervals
         return True
 
+    def _log_edits(self):
+        '''Append the days edited since the last save to the change log.'''
+        self.save_old_day()
+
+        try:
+            records = storage.get_log_records(self.months)
+        except (TypeError, ValueError) as err:
+            logging.warning('Edited days could not be logged: %s' % err)
+            self.save_to_disk(background=True)
+            return
+
+        if records:
+            self.writer.submit(self.change_log.append, (records,), self._on_logged)
+
+    def _on_logged(self, result, error):
+        if error:
+            logging.warning('Edited days could not be logged: %s' % error)
+            # The edited months are still marked as edited.
+            self.save_to_disk(background=True)
+            return
+        self.show_message(_('The content has been saved to %s') % self.dirs.data_dir, error=False)
+        self.frame.cloud.update(force_update=True)
+
+    def _replay_change_log(self):
+        '''Restore the edits that had not been saved to the month files.'''
+        records = self.change_log.read()
+        if not records:
+            return
+        logging.info('Restoring %d unsaved edits from %s' % (len(records), self.change_log.path))
+        for date, content in records:
+            month = self.get_month(date)
+            month.get_day(date.day).content = content
+            month.edited = True
+
     def open_journal(self, data_dir):
         if not os.path.exists(data_dir):
             logging.warning('The dir %s does not exist. Select a different dir.'
@@ -332,8 +479,33 @@ class Journal:
 
         self.month = None
         self.months.clear()
-
-        self.months = storage.load_all_months_from_disk(data_dir)
+        self.day_index = None
+        self.text_index = None
+        self.tag_index = None
+        self.word_counter = None
+        self.edited_while_counting = None
+
+        self.month_cache = storage.MonthCache(data_dir)
+        self.search_index_file = None
+        if self.config.read('searchIndexFile'):
+            self.search_index_file = storage.SearchIndexFile(data_dir)
+        if args.cache_action == 'rebuild':
+            logging.info('Rebuilding the journal cache')
+            self.month_cache.clear()
+            if self.search_index_file:
+                self.search_index_file.clear()
+        elif args.cache_action == 'verify':
+            stale_files = self.month_cache.verify()
+            logging.info('Journal cache verified, %d stale entries removed' % len(stale_files))
+        # The option only applies to the journal opened at startup.
+        args.cache_action = None
+
+        # Only parse the month files when they are needed.
+        self.months = storage.load_all_months_from_disk(
+            data_dir, lazy=True, cache=self.month_cache)
+
+        self.change_log = storage.ChangeLog(data_dir, self.durable_saving)
+        self._replay_change_log()
 
         # Nothing to save before first day change
         self.load_day(self.actual_date)
@@ -343,15 +515,12 @@ class Journal:
         if self.is_first_start and not os.listdir(data_dir) and len(self.days) == 0:
             self.add_instruction_content()
 
-        self.frame.cloud.update(force_update=True)
-
         # Reset Search
         self.frame.search_box.clear()
 
-        self.frame.categories_tree_view.categories = self.categories
-        # Add auto-completion for tag search
-        self.frame.search_box.set_entries([u'#%s' % self.normalize_tag(tag)
-                                           for tag in self.categories])
+        # Load the remaining months after the window has been shown.
+        unloaded_months = sorted(month for month in self.months.values() if not month.loaded)
+        gobject.idle_add(self._prefetch_months, self.months, unloaded_months)
 
         self.title = filesystem.get_journal_title(data_dir)
 
@@ -365,6 +534,85 @@ class Journal:
             rel_data_dir = filesystem.get_relative_path(self.dirs.app_dir, data_dir)
             self.config['dataDir'] = rel_data_dir
 
+    def _prefetch_months(self, months, unloaded_months):
+        '''
+        Load one month per call, starting with the most recent one.
+
+        Return False to stop being called when all months have been loaded.
+        '''
+        if months is not self.months:
+            # The journal has been changed in the meantime.
+            return False
+        if unloaded_months:
+            month = unloaded_months.pop()
+            if not month.try_load():
+                self._on_prefetch_error(month.path)
+                return False
+            return True
+        self._on_months_loaded()
+        return False
+
+    def _on_prefetch_error(self, path):
+        '''
+        The user may already be editing, so don't exit like we do for
+        corrupt files at startup. Log the edits, which are restored on the
+        next start, and stop loading the remaining months.
+        '''
+        self._log_edits()
+        self.show_message(
+            _('The file %s could not be read. Please fix or remove it and restart RedNotebook.')
+            % path, error=True)
+
+    def _on_months_loaded(self):
+        logging.debug('All months have been loaded')
+        self.writer.submit(self.month_cache.save, ())
+        self._get_text_index()
+        self._build_counters_in_background()
+
+    def _build_counters_in_background(self):
+        '''
+        Build the word counter and the tag index from copies of all days in
+        the writer thread. Days edited in the meantime are counted again
+        when the counters are done.
+        '''
+        if self.edited_while_counting is not None:
+            return
+        self.edited_while_counting = set()
+        copies = dict((day.date, day.copy()) for day in self._get_day_index().days)
+        self.writer.submit(self._count_days, (copies.values(),),
+                           functools.partial(self._on_counters_built, self.months, copies))
+
+    @staticmethod
+    def _count_days(days):
+        '''Runs in the writer thread.'''
+        return index.WordCounter(days), index.TagIndex(days)
+
+    def _on_counters_built(self, months, copies, counters, error):
+        if months is not self.months:
+            # The journal has been changed in the meantime.
+            return
+        edited_dates = self.edited_while_counting
+        self.edited_while_counting = None
+        if error:
+            return
+        word_counter, tag_index = counters
+        for date in edited_dates:
+            day = self.get_month(date).get_day(date.day)
+            old_words = copies[date].get_words() if date in copies else []
+            word_counter.replace(date, old_words, day.get_words())
+            tag_index.update(day)
+        # Keep the counters that have been built in the main thread meanwhile.
+        if self.word_counter is None:
+            self.word_counter = word_counter
+        if self.tag_index is None:
+            self.tag_index = tag_index
+        self.frame.cloud.update(force_update=True)
+
+        self.frame.categories_tree_view.categories = self.categories
+        # Add auto-completion for tag search
+        self.frame.search_box.set_entries([u'#%s' % self.normalize_tag(tag)
+                                           for tag in self.categories])
+
     def set_frame_title(self):
         parts = ['RedNotebook']
         if self.title != 'data':
@@ -388,13 +636,31 @@ class Journal:
 
     def save_old_day(self):
         '''Order is important'''
-        old_content = self.day.content
-        self.day.content = self.frame.categories_tree_view.get_day_content()
-        self.day.text = self.frame.get_day_text()
-
-        content_changed = (old_content != self.day.content)
+        # Use the decoded text to compare the old and new content.
+        old_content = dict(self.day.content, text=self.day.text)
+        new_content = self.frame.categories_tree_view.get_day_content()
+        new_content['text'] = self.frame.get_day_text()
+
+        # Only replace the content (and drop the cached values computed
+        # from it) if it has changed.
+        content_changed = (old_content != new_content)
         if content_changed:
+            old_words = self.day.get_words() if self.word_counter is not None else None
+            self.day.content = new_content
             self.month.edited = True
+            self.day.edited = True
+            if self.text_index is not None:
+                self.text_index.update(self.day)
+            if self.tag_index is not None:
+                self.tag_index.update(self.day)
+            if self.word_counter is not None:
+                self.word_counter.replace(self.day.date, old_words, self.day.get_words())
+            if self.edited_while_counting is not None:
+                self.edited_while_counting.add(self.day.date)
+            if self.stats is not None:
+                self.stats.invalidate(self.day.date)
+        if self.day_index is not None:
+            self.day_index.update(self.day)
 
         self.frame.calendar.set_day_edited(self.date.day, not self.day.empty)
 
@@ -418,8 +684,22 @@ class Journal:
             date = new_day.date
             month = self.get_month(date)
             old_day = month.get_day(date.day)
+            old_words = old_day.get_words() if self.word_counter is not None else None
             old_day.merge(new_day)
+            old_day.edited = True
             month.edited = True
+            if self.day_index is not None:
+                self.day_index.update(old_day)
+            if self.text_index is not None:
+                self.text_index.update(old_day)
+            if self.tag_index is not None:
+                self.tag_index.update(old_day)
+            if self.word_counter is not None:
+                self.word_counter.replace(date, old_words, old_day.get_words())
+            if self.edited_while_counting is not None:
+                self.edited_while_counting.add(date)
+            if self.stats is not None:
+                self.stats.invalidate(date)
 
     @property
     def day(self):
@@ -467,47 +747,111 @@ class Journal:
 
     @property
     def categories(self):
-        return list(sorted(set(itertools.chain.from_iterable(
-            day.categories for day in self.days)), cmp=locale.strcoll))
+        if self.frame:
+            self.save_old_day()
+        return sorted(self._get_tag_index().tags, cmp=locale.strcoll)
 
     def normalize_tag(self, tag):
         return tag.replace(' ', '_').lower()
 
     def get_entries(self, category):
-        entries = set()
-        for day in self.days:
-            entries |= set(day.get_entries(category))
-        return sorted(entries)
-
-    def search(self, text, tags):
-        days = self.get_days_with_tags(tags)
-        results = []
-        for day in reversed(days):
-            results.append(day.search(text, tags))
-        return results
-
-    def get_days_with_tags(self, tags):
-        if not tags:
-            return self.days
-        days = []
-        for day in self.days:
-            day_tags = set(data.escape_tag(tag) for tag in day.categories)
-            if all(tag in day_tags for tag in tags):
-                days.append(day)
+        if self.frame:
+            self.save_old_day()
+        return self._get_tag_index().get_entries(category)
+
+    def get_days_to_search(self, query):
+        '''
+        Return the days that may match the query (see rednotebook.query),
+        newest first.
+        '''
+        if self.frame:
+            self.save_old_day()
+        plan = Plan(query, self._get_day_index(), self._get_tag_index(), self._get_text_index(),
+                    fuzzy=self.config.read('searchFuzzy'),
+                    ignore_accents=self.config.read('searchIgnoreAccents'))
+        days = plan.execute()
+        logging.debug(u'Search plan:\n%s', plan)
+        days.reverse()
         return days
 
-    def get_word_count_dict(self):
+    def get_word_count_dict(self, start_date=None, end_date=None):
         '''
         Returns a dictionary mapping the words to their number of appearance
+        in the optional date range
+        '''
+        if self.frame:
+            self.save_old_day()
+        word_counter = self._get_word_counter()
+        date_range = self._get_date_range(start_date, end_date)
+        if date_range is None:
+            return word_counter.counts
+        return word_counter.get_counts(self._get_day_index(), *date_range)
+
+    def get_cloud_counts(self, start_date=None, end_date=None):
+        '''
+        Return lists of counters whose sums are the numbers of days with
+        each tag name and the word counts in the optional date range (see
+        index.sum_counts). The counters are not changed afterwards, so they
+        can be summed in another thread.
+
+        Return None while the counters are built in the background. The
+        cloud is updated when they are done.
+        '''
+        if self.word_counter is None or self.tag_index is None:
+            if self.day_index is not None:
+                self._build_counters_in_background()
+            return None
+        if self.frame:
+            self.save_old_day()
+        date_range = self._get_date_range(start_date, end_date) or ()
+        day_index = self._get_day_index()
+        return (self.tag_index.get_name_count_parts(day_index, *date_range),
+                self.word_counter.get_parts(day_index, *date_range))
+
+    def _get_date_range(self, start_date, end_date):
+        '''
+        Limit the date range to the edited days. Return None if it covers
+        the whole journal.
         '''
-        # TODO: Use collections.Counter in Python2.7
-        # TODO: Check if concatenating all text and using a regex is faster.
-        word_dict = defaultdict(int)
-        for day in self.days:
-            words = day.get_words()
-            for word in words:
-                word_dict[word.lower()] += 1
-        return word_dict
+        days = self._get_day_index().dates
+        if not days or ((start_date is None or start_date <= days[0]) and
+                        (end_date is None or end_date >= days[-1])):
+            return None
+        start_date = days[0] if start_date is None else max(start_date, days[0])
+        end_date = days[-1] if end_date is None else min(end_date, days[-1])
+        return start_date, end_date
+
+    def _get_word_counter(self):
+        if self.word_counter is None:
+            self.word_counter = index.WordCounter(self._get_day_index().days)
+        return self.word_counter
+
+    def _get_day_index(self):
+        if self.day_index is None:
+            # Parse all remaining month files at once.
+            storage.load_months(self.months.values(), self.load_workers, save_caches=False)
+            self.writer.submit(self.month_cache.save, ())
+            self.day_index = index.DayIndex(self.months.values())
+        return self.day_index
+
+    def _get_text_index(self):
+        if self.text_index is None:
+            self._get_day_index()
+            self.text_index = storage.load_text_index(self.months.values(), self.search_index_file)
+            self._save_search_index()
+        return self.text_index
+
+    def _get_tag_index(self):
+        if self.tag_index is None:
+            self.tag_index = index.TagIndex(self._get_day_index().days)
+        return self.tag_index
+
+    def _save_search_index(self):
+        '''Write the outdated entries of the search index file in the writer thread.'''
+        if self.text_index is not None and self.search_index_file is not None:
+            entries, paths = storage.get_index_entries(
+                self.text_index, self.months.values(), self.search_index_file)
+            self.writer.submit(storage.update_index_file, (self.search_index_file, entries, paths))
 
     @property
     def days(self):
@@ -518,17 +862,7 @@ class Journal:
         if self.frame:
             self.save_old_day()
 
-        days = []
-        for month in self.months.values():
-            days_in_month = month.days.values()
-
-            # Filter out days without content
-            days_in_month = [day for day in days_in_month if not day.empty]
-            days.extend(days_in_month)
-
-        # Sort days
-        days = sorted(days, key=lambda day: day.date)
-        return days
+        return self._get_day_index().days[:]
 
     def get_days_in_date_range(self, start_date=None, end_date=None):
         if not start_date:
@@ -539,15 +873,10 @@ class Journal:
         start_date, end_date = sorted([start_date, end_date])
         assert start_date <= end_date
 
-        days_in_date_range = []
-        for day in self.days:
-            if day.date < start_date:
-                continue
-            elif start_date <= day.date <= end_date:
-                days_in_date_range.append(day)
-            elif day.date > end_date:
-                break
-        return days_in_date_range
+        if self.frame:
+            self.save_old_day()
+
+        return self._get_day_index().get_days_in_date_range(start_date, end_date)
 
     def add_instruction_content(self):
         self.change_date(datetime.date.today())
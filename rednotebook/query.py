@@ -0,0 +1,359 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------
+# Copyright (c) 2009  Jendrik Seipp
+#
+# RedNotebook is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# RedNotebook is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with RedNotebook; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+# -----------------------------------------------------------------------
+
+'''
+Search queries.
+
+Queries consist of whitespace-separated terms. All terms must match a day:
+
+    word, "some phrase"      text (case-insensitive substring)
+    #tag                     day has the tag
+    tag:entry, #tag:"a b"    an entry of the tag contains the text
+    before:2015-03-01        date filters, also for YYYY and YYYY-MM
+    after:2015, in:2015-03
+    -term                    day must not match the term
+    term OR term             one of the terms must match
+'''
+
+import datetime
+import heapq
+import math
+import re
+
+from rednotebook.data import (
+    TEXT_RESULT_LENGTH, casefold, compile_search_pattern, escape_tag, get_text_with_dots)
+from rednotebook.index import normalize
+from rednotebook.util import dates
+
+
+TOKEN = re.compile(
+    r'(?P<exclude>-)?(?:(?P<key>[^\s":]+):)?(?:"(?P<phrase>[^"]*)"?|(?P<word>\S+))',
+    flags=re.U)
+PERIOD = re.compile(r'^(\d{4})(?:-(\d{1,2})(?:-(\d{1,2}))?)?$')
+DATE_FILTERS = ['before', 'after', 'in']
+# Days lose half of their recency boost every year.
+RECENCY_HALF_LIFE = 365.0
+
+
+def add_days(date, days):
+    '''Return None if the result lies outside of the supported dates.'''
+    try:
+        return date + datetime.timedelta(days=days)
+    except OverflowError:
+        return None
+
+
+def parse_period(value):
+    '''
+    Return the first and last date of a period (YYYY, YYYY-MM or
+    YYYY-MM-DD) or None if the value is no valid period.
+    '''
+    match = PERIOD.match(value)
+    if not match:
+        return None
+    year, month, day = [int(part) if part else None for part in match.groups()]
+    try:
+        if day:
+            first = last = datetime.date(year, month, day)
+        elif month:
+            first = datetime.date(year, month, 1)
+            last = datetime.date(year, month, dates.get_number_of_days(year, month))
+        else:
+            first, last = datetime.date(year, 1, 1), datetime.date(year, 12, 31)
+    except ValueError:
+        return None
+    return first, last
+
+
+class Text(object):
+    cost = 3
+
+    def __init__(self, text):
+        self.text = text
+
+    def get_dates(self, plan):
+        # The text index may return days without the text.
+        return plan.text_index.find(self.text)
+
+    def matches(self, day):
+        return day.contains(self.text)
+
+    def __unicode__(self):
+        return u'"%s"' % self.text if u' ' in self.text else self.text
+
+
+class Tag(object):
+    cost = 1
+
+    def __init__(self, tag):
+        self.tag = escape_tag(tag)
+
+    def get_dates(self, plan):
+        return set(plan.tag_index.get_dates([self.tag], plan.start_date, plan.end_date))
+
+    def matches(self, day):
+        return any(escape_tag(category) == self.tag for category in day.categories)
+
+    def __unicode__(self):
+        return u'#' + self.tag
+
+
+class TagEntry(Tag):
+    cost = 2
+
+    def __init__(self, tag, entry, raw):
+        Tag.__init__(self, tag)
+        self.entry = entry
+        self.folded_entry = normalize(entry)
+        # Terms like "http://example.com" look like tag entries.
+        self.raw = raw
+
+    def matches(self, day):
+        return day.has_tag_entry(self.tag, self.folded_entry)
+
+    def __unicode__(self):
+        return u'#%s:"%s"' % (self.tag, self.entry)
+
+
+class Query(object):
+    def __init__(self):
+        # Each clause is a list of alternatives.
+        self.clauses = []
+        self.excluded = []
+        self.start_date = None
+        self.end_date = None
+        self._patterns = {}
+
+    @property
+    def empty(self):
+        return not (self.clauses or self.excluded or self.start_date or self.end_date)
+
+    @property
+    def texts(self):
+        return [atom.text for clause in self.clauses for atom in clause if isinstance(atom, Text)]
+
+    @property
+    def tags(self):
+        return [atom.tag for clause in self.clauses for atom in clause if isinstance(atom, Tag)]
+
+    def resolve(self, tags):
+        '''
+        Treat tag entry terms whose tag is not in tags as texts.
+        '''
+        def resolve_atom(atom):
+            if isinstance(atom, TagEntry) and atom.tag not in tags:
+                return Text(atom.raw)
+            return atom
+        self.clauses = [[resolve_atom(atom) for atom in clause] for clause in self.clauses]
+        self.excluded = [resolve_atom(atom) for atom in self.excluded]
+
+    def expand(self, get_variants):
+        '''
+        Let each searched word also match the variants returned by
+        get_variants(word). Phrases and excluded words are not expanded.
+        '''
+        for clause in self.clauses:
+            words = [atom.text for atom in clause if isinstance(atom, Text) and len(atom.text.split()) == 1]
+            texts = set(casefold(atom.text) for atom in clause if isinstance(atom, Text))
+            for word in words:
+                for variant in get_variants(casefold(word)):
+                    if variant not in texts:
+                        texts.add(variant)
+                        clause.append(Text(variant))
+
+    def matches(self, day):
+        if self.start_date and day.date < self.start_date:
+            return False
+        if self.end_date and day.date > self.end_date:
+            return False
+        return (all(any(atom.matches(day) for atom in clause) for clause in self.clauses) and
+                not any(atom.matches(day) for atom in self.excluded))
+
+    def score(self, day, today):
+        '''
+        Rate the day by how often it contains the searched texts and by
+        how recent it is. The recency boost lies between 0 and 1.
+        '''
+        text = day.folded_text
+        frequency = sum(math.log(1 + text.count(normalize(term))) for term in self.texts)
+        age = max(0, (today - day.date).days)
+        return frequency + 0.5 ** (age / RECENCY_HALF_LIFE)
+
+    def _get_pattern(self, text):
+        if text not in self._patterns:
+            self._patterns[text] = compile_search_pattern(text)
+        return self._patterns[text]
+
+    def get_results(self, day):
+        '''
+        Return the date string and the results for a matching day. Each
+        result is a pair of the number of matches and a list of snippets.
+        '''
+        date_string = str(day)
+        start_of_text = [get_text_with_dots(day.text, 0, TEXT_RESULT_LENGTH)]
+        results = []
+        for text in self.texts:
+            if text in date_string:
+                results.append((1, start_of_text))
+                continue
+            count, snippets = day.find_in_text(self._get_pattern(text))
+            if count:
+                results.append((count, snippets))
+            results.extend((1, [entry]) for entry in day.search_in_categories(text))
+        if not results and self.tags:
+            results = [(1, [entry]) for entry in day.search(u'', self.tags)[1]]
+        return date_string, results or [(1, start_of_text)]
+
+    def __unicode__(self):
+        parts = []
+        # The first and last supported dates are no restriction.
+        day_before_start = self.start_date and add_days(self.start_date, -1)
+        if day_before_start:
+            parts.append(u'after:%s' % day_before_start)
+        day_after_end = self.end_date and add_days(self.end_date, 1)
+        if day_after_end:
+            parts.append(u'before:%s' % day_after_end)
+        parts.extend(u' OR '.join(unicode(atom) for atom in clause) for clause in self.clauses)
+        parts.extend(u'-%s' % atom for atom in self.excluded)
+        return u' '.join(parts)
+
+
+def rank(query, days, limit=None, today=None):
+    '''
+    Return the days that match the query, the best ones first.
+
+    With a limit, only the best days are kept in a heap while going
+    through the days.
+    '''
+    today = today or datetime.date.today()
+    matching = (day for day in days if query.matches(day))
+
+    def get_key(day):
+        return query.score(day, today), day.date
+    if limit:
+        return heapq.nlargest(limit, matching, key=get_key)
+    return sorted(matching, key=get_key, reverse=True)
+
+
+def _restrict_dates(query, key, period):
+    first, last = period
+    # Clamp the bounds to the supported dates.
+    if key == 'before':
+        start, end = None, add_days(first, -1) or datetime.date.min
+    elif key == 'after':
+        start, end = add_days(last, 1) or datetime.date.max, None
+    else:
+        start, end = first, last
+    if start and (query.start_date is None or start > query.start_date):
+        query.start_date = start
+    if end and (query.end_date is None or end < query.end_date):
+        query.end_date = end
+
+
+def parse_query(text):
+    query = Query()
+    join_next = False
+    for match in TOKEN.finditer(text):
+        exclude, key, phrase, word = match.group('exclude', 'key', 'phrase', 'word')
+        raw = match.group(0)[len(exclude or ''):]
+        if not (exclude or key or phrase is not None) and word == u'OR':
+            join_next = bool(query.clauses)
+            continue
+        value = phrase if phrase is not None else word
+        if key:
+            period = parse_period(value)
+            if key in DATE_FILTERS and period and not exclude:
+                _restrict_dates(query, key, period)
+                join_next = False
+                continue
+            atom = TagEntry(key.lstrip(u'#'), value, raw)
+        elif phrase is None and len(word) > 1 and word.startswith(u'#'):
+            atom = Tag(word[1:])
+        elif value:
+            atom = Text(value)
+        else:
+            continue
+        if exclude:
+            query.excluded.append(atom)
+        elif join_next:
+            query.clauses[-1].append(atom)
+        else:
+            query.clauses.append([atom])
+        join_next = False
+    return query
+
+
+class Plan(object):
+    '''
+    Evaluation order of a query.
+
+    Date filters are answered from the sorted days, tags from the tag index
+    and texts from the text index. Each step intersects the candidate days
+    with the days it finds. The text index looks up the terms containing a
+    text in its whole vocabulary, not only in the remaining candidates. The
+    candidates may not match the query, so rank() checks each of them with
+    Query.matches(). str(plan) shows the steps and the number of candidates
+    after each step.
+    '''
+    def __init__(self, query, day_index, tag_index, text_index, fuzzy=False, ignore_accents=False):
+        query.resolve(tag_index.postings)
+        if fuzzy or ignore_accents:
+            query.expand(lambda word: text_index.get_variants(word, fuzzy, ignore_accents))
+        self.query = query
+        self.day_index = day_index
+        self.tag_index = tag_index
+        self.text_index = text_index
+        self.start_date = query.start_date
+        self.end_date = query.end_date
+        self.clauses = sorted(query.clauses, key=lambda clause: max(atom.cost for atom in clause))
+        # Excluding tags is exact, all other exclusions are checked later.
+        self.excluded_tags = [atom for atom in query.excluded if type(atom) is Tag]
+        self.steps = []
+
+    def execute(self):
+        '''Return the candidate days sorted by date.'''
+        self.steps = []
+        # Dates of the candidate days or None for all days.
+        candidates = None
+        if self.start_date or self.end_date:
+            days = self.day_index.get_days_in_date_range(
+                self.start_date or datetime.date.min, self.end_date or datetime.date.max)
+            candidates = set(day.date for day in days)
+            description = u'dates %s to %s' % (self.start_date or u'start', self.end_date or u'end')
+            self.steps.append((description, len(candidates)))
+        for clause in self.clauses:
+            clause_dates = set()
+            for atom in clause:
+                clause_dates |= atom.get_dates(self)
+            candidates = clause_dates if candidates is None else candidates & clause_dates
+            self.steps.append((u' OR '.join(unicode(atom) for atom in clause), len(candidates)))
+        for atom in self.excluded_tags:
+            if candidates is None:
+                candidates = set(self.day_index.dates)
+            candidates -= atom.get_dates(self)
+            self.steps.append((u'-%s' % atom, len(candidates)))
+        if candidates is None:
+            return self.day_index.days[:]
+        return [self.day_index.get_day(date) for date in sorted(candidates)]
+
+    def __unicode__(self):
+        lines = [u'%d. %s: %d days' % (number, description, count)
+                 for number, (description, count) in enumerate(self.steps, start=1)]
+        lines.append(u'%d. check each day for: %s' % (len(self.steps) + 1, self.query))
+        return u'\n'.join(lines)
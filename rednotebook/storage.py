@@ -18,12 +18,18 @@
 # -----------------------------------------------------------------------
 
 import codecs
+import datetime
+import json
 import logging
+import marshal
+import multiprocessing
 import os
+import Queue
 import re
 import shutil
 import stat
 import sys
+import threading
 
 
 try:
@@ -40,13 +46,33 @@ except ImportError:
     from yaml import Loader, Dumper
     logging.info('Using pyyaml for loading and dumping')
 
+from rednotebook import index
 from rednotebook.data import Month
 
 
+# Parsed month files are cached in this file in the journal directory.
+CACHE_FILENAME = '.rednotebook-cache'
+CACHE_VERSION = 1
+
+# The search terms of all days are stored in this file in the journal directory.
+INDEX_FILENAME = '.rednotebook-index'
+INDEX_VERSION = 2
+
+# Edited days are appended to this file in the journal directory.
+LOG_FILENAME = '.rednotebook-log'
+# Compact the change log into the month files when it grows larger (bytes).
+MAX_LOG_SIZE = 1024 * 1024
+
+
 def format_year_and_month(year, month):
     return '%04d-%02d' % (year, month)
 
 
+def get_month_path(journal_dir, month, infix=''):
+    year_and_month = format_year_and_month(month.year_number, month.month_number)
+    return os.path.join(journal_dir, '%s%s.txt' % (year_and_month, infix))
+
+
 def get_journal_files(data_dir):
     # Format: 2010-05.txt
     date_exp = re.compile(r'(\d{4})-(\d{2})\.txt$')
@@ -63,109 +89,690 @@ def get_journal_files(data_dir):
             logging.debug('%s is not a valid month filename' % file)
 
 
-def _load_month_from_disk(path, year_number, month_number):
+def _parse_month_file(path):
     '''
-    Load the month file at path and return a month object
+    Parse the month file at path and return (content, mtime, error).
 
-    If an error occurs, return None
+    This function also runs in worker processes, so it only returns plain
+    data and doesn't log: a logging lock held by another thread while the
+    process was forked would never be released. If the file cannot be
+    parsed, content and mtime are None and error holds the message to log.
     '''
     try:
         # Try to read the contents of the file.
         with codecs.open(path, 'rb', encoding='utf-8') as month_file:
-            logging.debug('Loading file "%s"' % path)
             month_contents = yaml.load(month_file, Loader=Loader)
-            month = Month(year_number, month_number, month_contents, os.path.getmtime(path))
-            return month
+            return month_contents, os.path.getmtime(path), None
     except yaml.YAMLError, exc:
-        logging.error('Error in file %s:\n%s' % (path, exc))
+        return None, None, 'Error in file %s:\n%s' % (path, exc)
     except IOError:
         # If that fails, there is nothing to load, so just display an error message.
-        logging.error('Error: The file %s could not be read' % path)
+        return None, None, 'Error: The file %s could not be read' % path
+
+
+def _check_parse_result(result):
+    month_contents, mtime, error = result
+    if error:
+        logging.error(error)
+        # If we continued here, the possibly corrupted file would be overwritten.
+        sys.exit(1)
+    return month_contents, mtime
+
+
+def _read_month_from_disk(path):
+    '''
+    Read the month file at path and return its content and mtime
+
+    If an error occurs, exit the program.
+    '''
+    logging.debug('Loading file "%s"' % path)
+    try:
+        result = _parse_month_file(path)
     except Exception:
         logging.error('An error occured while reading %s:' % path)
         raise
-    # If we continued here, the possibly corrupted file would be overwritten.
-    sys.exit(1)
+    return _check_parse_result(result)
+
+
+def _read_months_from_disk(paths, workers=None):
+    '''
+    Read the given month files and return a dict mapping each path to
+    its content and mtime.
+
+    The files are parsed by a pool of worker processes that only exists
+    during this call. workers=None uses one worker per CPU. We fall back
+    to reading the files one after another for a single worker or file
+    and on platforms without fork().
+
+    The workers are forked, possibly while other threads are running.
+    This is safe because they only run _parse_month_file, which takes no
+    locks that those threads might hold.
+    '''
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    workers = min(workers, len(paths))
+    if workers <= 1 or not hasattr(os, 'fork'):
+        return dict((path, _read_month_from_disk(path)) for path in paths)
+
+    logging.debug('Parsing %d files with %d processes' % (len(paths), workers))
+    pool = multiprocessing.Pool(workers)
+    try:
+        results = pool.map(_parse_month_file, paths)
+    except Exception:
+        logging.error('An error occured while reading the journal files:')
+        raise
+    finally:
+        pool.close()
+        pool.join()
+    return dict((path, _check_parse_result(result))
+                for path, result in zip(paths, results))
+
+
+class MarshalCache(object):
+    '''
+    Cache of data derived from the month files.
+
+    The cache maps each month filename to the mtime and size of the file
+    and the marshalled data. An entry is only used while the file still
+    has the same mtime and size. If the cache file is missing or corrupt,
+    we start with an empty cache and rebuild it while loading the months.
+    '''
+    filename = None
+    version = None
+    description = None
+
+    def __init__(self, data_dir):
+        self.data_dir = os.path.abspath(data_dir)
+        self.path = os.path.join(self.data_dir, self.filename)
+        self.entries = self._read()
+        self.changed = False
+
+    def _read(self):
+        try:
+            with open(self.path, 'rb') as cache_file:
+                version, entries = marshal.load(cache_file)
+        except IOError:
+            return {}
+        except (EOFError, ValueError, TypeError):
+            logging.warning('The %s %s is corrupt and will be rebuilt' % (self.description, self.path))
+            return {}
+        if version != self.version or not isinstance(entries, dict):
+            logging.info('Rebuilding %s of an older format' % self.description)
+            return {}
+        return entries
+
+    def _get_key(self, path):
+        '''Return the filename for paths in the journal dir and None otherwise.'''
+        if os.path.dirname(os.path.abspath(path)) != self.data_dir:
+            return None
+        return os.path.basename(path)
+
+    def get(self, path):
+        '''
+        Return (content, mtime) for the month file at path or None if the
+        cache has no up-to-date entry for the file.
+        '''
+        entry = self.entries.get(self._get_key(path))
+        if entry is None:
+            return None
+        mtime, size, data = entry
+        try:
+            file_stat = os.stat(path)
+        except OSError:
+            return None
+        if (file_stat.st_mtime, file_stat.st_size) != (mtime, size):
+            return None
+        try:
+            return marshal.loads(data), mtime
+        except (EOFError, ValueError, TypeError):
+            logging.warning('Invalid cache entry for %s' % path)
+            self.remove(path)
+            return None
+
+    def set(self, path, content, mtime):
+        key = self._get_key(path)
+        if key is None:
+            return
+        try:
+            data = marshal.dumps(content)
+            size = os.path.getsize(path)
+        except ValueError:
+            # The YAML loader may have returned objects like dates.
+            logging.debug('Content of %s cannot be cached' % path)
+            self.remove(path)
+            return
+        except OSError:
+            self.remove(path)
+            return
+        self.entries[key] = (mtime, size, data)
+        self.changed = True
+
+    def remove(self, path):
+        if self.entries.pop(self._get_key(path), None) is not None:
+            self.changed = True
+
+    def retain(self, paths):
+        '''Remove the entries of all files that are not in paths.'''
+        keys = set(self._get_key(path) for path in paths)
+        for key in list(self.entries):
+            if key not in keys:
+                del self.entries[key]
+                self.changed = True
+
+    def clear(self):
+        self.entries = {}
+        self.changed = True
+
+    def save(self):
+        if not self.changed:
+            return
+        new = self.path + '.new'
+        # Entries may be set by another thread while we write the file.
+        self.changed = False
+        try:
+            with open(new, 'wb') as cache_file:
+                marshal.dump((self.version, self.entries), cache_file)
+            # Month caches and search indexes reveal the journal's contents,
+            # so only the owner may read them.
+            os.chmod(new, stat.S_IRUSR | stat.S_IWUSR)
+            if sys.platform == 'win32' and os.path.exists(self.path):
+                os.remove(self.path)
+            os.rename(new, self.path)
+        except (IOError, OSError) as err:
+            # The cache is optional, so we only log the error.
+            logging.warning('The %s could not be written: %s' % (self.description, err))
+            self.changed = True
+        else:
+            logging.debug('Wrote %s %s' % (self.description, self.path))
+
+
+class MonthCache(MarshalCache):
+    '''
+    Cache of parsed month files that lets us skip YAML parsing.
+    '''
+    filename = CACHE_FILENAME
+    version = CACHE_VERSION
+    description = 'journal cache'
+
+    def verify(self):
+        '''
+        Compare all up-to-date entries with the parsed month files, drop
+        the entries that differ and return their filenames.
+        '''
+        stale = []
+        for key in sorted(self.entries):
+            path = os.path.join(self.data_dir, key)
+            cached = self.get(path)
+            if cached is None:
+                continue
+            if cached != _read_month_from_disk(path):
+                logging.warning('Cache entry for %s does not match the file' % path)
+                self.remove(path)
+                stale.append(key)
+        return stale
+
+
+class SearchIndexFile(MarshalCache):
+    '''
+    Search terms of the days in each month file (see index.TextIndex).
+
+    The journal never depends on this file. Months without an up-to-date
+    entry are indexed from their content again.
+    '''
+    filename = INDEX_FILENAME
+    version = INDEX_VERSION
+    description = 'search index'
+
+    def get_terms(self, path, month):
+        '''
+        Return a dictionary mapping the numbers of all non-empty days of the
+        month to their terms or None if the entry doesn't match the month.
+        '''
+        if month.edited:
+            return None
+        cached = self.get(path)
+        if cached is None:
+            return None
+        day_terms, mtime = cached
+        day_numbers = set(number for number, day in month.days.items() if not day.empty)
+        if mtime != month.mtime or set(day_terms) != day_numbers:
+            return None
+        return day_terms
+
+
+def load_text_index(months, index_file=None):
+    '''
+    Index all days. Take the terms of unchanged months from the index file.
+    '''
+    text_index = index.TextIndex()
+    for month in months:
+        day_terms = index_file and index_file.get_terms(
+            get_month_path(index_file.data_dir, month), month)
+        if day_terms:
+            for day_number, terms in day_terms.items():
+                text_index.add_terms(month.days[day_number].date, frozenset(terms))
+        else:
+            for day in month.days.values():
+                if not day.empty:
+                    text_index.add(day)
+    return text_index
+
+
+def get_day_terms(text_index, month):
+    '''
+    Return a dictionary mapping the numbers of the month's non-empty days
+    to their terms or None if not all of these days are indexed.
+    '''
+    days = [day for day in month.days.values() if not day.empty]
+    if not all(day.date in text_index.day_terms for day in days):
+        return None
+    return dict((day.day_number, list(text_index.day_terms[day.date])) for day in days)
+
+
+def get_index_entries(text_index, months, index_file):
+    '''
+    Return (path, day_terms, mtime) triples for all saved months with an
+    outdated entry in the index file and the paths of all months.
+    '''
+    entries = []
+    paths = []
+    for month in months:
+        path = get_month_path(index_file.data_dir, month)
+        paths.append(path)
+        if month.edited or not os.path.exists(path):
+            continue
+        entry = index_file.entries.get(os.path.basename(path))
+        if entry and entry[0] == month.mtime:
+            continue
+        day_terms = get_day_terms(text_index, month)
+        if day_terms is not None:
+            entries.append((path, day_terms, month.mtime))
+    return entries, paths
+
+
+def update_index_file(index_file, entries, paths):
+    '''Store the entries (see get_index_entries) and save the index file.'''
+    for path, day_terms, mtime in entries:
+        index_file.set(path, day_terms, mtime)
+    index_file.retain(paths)
+    index_file.save()
+
+
+class LazyMonth(Month):
+    '''
+    Month whose file is only parsed when its days are needed for the first
+    time.
+
+    If a MonthCache is given, the content is taken from the cache if the
+    file has not changed since it was cached.
+    '''
+    __slots__ = ('path', 'cache')
+
+    def __init__(self, path, year_number, month_number, cache=None):
+        Month.__init__(self, year_number, month_number, mtime=os.path.getmtime(path))
+        self.path = path
+        self.cache = cache
+        self._days = None
+
+    def _read_content(self):
+        cached = self.cache and self.cache.get(self.path)
+        if cached:
+            month_contents, self.mtime = cached
+        else:
+            month_contents, self.mtime = _read_month_from_disk(self.path)
+            if self.cache:
+                self.cache.set(self.path, month_contents, self.mtime)
+        return month_contents
+
+    def try_load(self):
+        '''
+        Load the month like load(), but if the file cannot be parsed, log
+        the error and return False instead of exiting. The month stays
+        unloaded then.
+        '''
+        if self.loaded:
+            return True
+        cached = self.cache and self.cache.get(self.path)
+        if cached:
+            self.set_content(*cached)
+            return True
+        month_contents, mtime, error = _parse_month_file(self.path)
+        if error:
+            logging.error(error)
+            return False
+        if self.cache:
+            self.cache.set(self.path, month_contents, mtime)
+        self.set_content(month_contents, mtime)
+        return True
+
+    def set_content(self, month_contents, mtime):
+        '''Load the month from content that has been read elsewhere.'''
+        if self._days is None:
+            self._days = self._create_days(month_contents or {})
+            self.mtime = mtime
 
 
-def load_all_months_from_disk(data_dir):
+def load_months(months, workers=None, save_caches=True):
+    '''
+    Parse the files of all given months that have not been loaded yet.
+
+    Months found in their cache are not parsed again. Newly parsed months
+    are added to their cache, which is saved unless save_caches is False.
+    '''
+    lazy_months = []
+    for month in months:
+        if month.loaded:
+            continue
+        cached = month.cache and month.cache.get(month.path)
+        if cached:
+            month.set_content(*cached)
+        else:
+            lazy_months.append(month)
+    if lazy_months:
+        logging.debug('%d months are not cached' % len(lazy_months))
+        contents = _read_months_from_disk([month.path for month in lazy_months], workers)
+        for month in lazy_months:
+            month_contents, mtime = contents[month.path]
+            if month.cache:
+                month.cache.set(month.path, month_contents, mtime)
+            month.set_content(month_contents, mtime)
+
+    if save_caches:
+        for cache in set(month.cache for month in months if getattr(month, 'cache', None)):
+            cache.save()
+
+
+def load_all_months_from_disk(data_dir, lazy=False, workers=None, cache=None):
     '''
     Load all months and return a directory mapping year-month values
     to month objects.
+
+    If lazy is True, the month files are only listed and each month is
+    parsed on first access. Otherwise the files are parsed by "workers"
+    processes (see _read_months_from_disk). If a MonthCache is given,
+    unchanged months are read from the cache instead.
     '''
     months = {}
+    paths = []
 
     logging.debug('Starting to load files in dir "%s"' % data_dir)
     for path, year_number, month_number in get_journal_files(data_dir):
-        month = _load_month_from_disk(path, year_number, month_number)
-        if month:
-            months[format_year_and_month(year_number, month_number)] = month
+        months[format_year_and_month(year_number, month_number)] = LazyMonth(
+            path, year_number, month_number, cache)
+        paths.append(path)
+    if cache:
+        cache.retain(paths)
+    if not lazy:
+        load_months(months.values(), workers)
 
     logging.debug('Finished loading files in dir "%s"' % data_dir)
     return months
 
 
-def _save_month_to_disk(month, journal_dir):
-    """
-    When overwriting 2014-12.txt:
-        write new content to 2014-12.new.txt
-        cp 2014-12.txt 2014-12.old.txt
-        mv 2014-12.new.txt 2014-12.txt
-        rm 2014-12.old.txt
+class ChangeLog(object):
+    '''
+    Append-only log of edited days (a write-ahead log for the month files).
+
+    Appending the content of the edited days is much cheaper than
+    rewriting their month files. Each line holds the date and the content
+    of one day as JSON. Later lines override earlier ones. The log is
+    replayed when the journal is opened, so edits survive crashes, and it
+    is cleared after the edited months have been saved ("compaction").
+
+    If durable is False, appended records are not synced to disk.
+    '''
+    def __init__(self, data_dir, durable=True):
+        self.path = os.path.join(data_dir, LOG_FILENAME)
+        self.durable = durable
+
+    @property
+    def size(self):
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    @staticmethod
+    def format_record(day):
+        return json.dumps({'date': str(day), 'content': day.content})
+
+    def append(self, records):
+        # The log contains day contents, so only the owner may read it.
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, stat.S_IRUSR | stat.S_IWUSR)
+        with os.fdopen(fd, 'ab') as log_file:
+            log_file.write(''.join(record + '\n' for record in records))
+            if self.durable:
+                log_file.flush()
+                os.fsync(log_file.fileno())
+
+    def read(self):
+        '''Return a list of (date, day_content) pairs in the order they were logged.'''
+        try:
+            with open(self.path, 'rb') as log_file:
+                lines = log_file.read().splitlines()
+        except IOError:
+            return []
+        records = []
+        for line_number, line in enumerate(lines, start=1):
+            try:
+                record = json.loads(line)
+                date = datetime.datetime.strptime(record['date'], '%Y-%m-%d').date()
+                content = record['content']
+            except (ValueError, KeyError, TypeError):
+                # The last line is incomplete if we crashed while writing it.
+                logging.warning('Skipping invalid line %d in %s' % (line_number, self.path))
+                continue
+            if not isinstance(content, dict) or 'text' not in content:
+                logging.warning('Skipping line %d without day content in %s' % (line_number, self.path))
+                continue
+            records.append((date, content))
+        return records
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def get_log_records(months):
+    '''
+    Return the change log records for all days that have been edited since
+    they were last logged or saved and mark the days as logged.
+    '''
+    days = []
+    for month in months.values():
+        if month.loaded and month.edited:
+            days.extend(day for day in month.days.values() if day.edited)
+    records = [ChangeLog.format_record(day) for day in sorted(days)]
+    for day in days:
+        day.edited = False
+    return records
+
+
+def _copy_day_content(content):
+    # Categories map to dicts of entries or None.
+    return dict((key, dict(value) if isinstance(value, dict) else value)
+                for key, value in content.iteritems())
+
+
+def take_snapshots(months, saveas=False):
+    '''
+    Return (month, content) pairs holding copies of the content of all
+    months that have to be saved and mark the months as saved.
+
+    The snapshots can be written while the months are edited further.
+    '''
+    snapshots = []
+    for year_and_month, month in sorted(months.items()):
+        # We always need to save everything when we are "saving as".
+        if month.edited or saveas:
+            content = {}
+            for day_number, day in month.days.iteritems():
+                if not day.empty:
+                    content[day_number] = _copy_day_content(day.content)
+                day.edited = False
+            month.edited = False
+            snapshots.append((month, content))
+    return snapshots
+
+
+def mark_unsaved(snapshots):
+    '''Mark the months of snapshots that could not be written as edited.'''
+    for month, content in snapshots:
+        month.edited = True
+
+
+def _fsync_dir(path):
+    '''Make renames in the directory durable.'''
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        # Directories cannot be opened on Windows.
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        # Some filesystems don't support fsync for directories.
+        pass
+    finally:
+        os.close(fd)
+
+
+def _write_month_to_disk(month, content, journal_dir, durable=True):
     """
-    content = {}
-    for day_number, day in month.days.iteritems():
-        if not day.empty:
-            content[day_number] = day.content
+    Write the month content to disk and return the filename or None if
+    nothing had to be written.
 
-    def get_filename(infix):
-        year_and_month = format_year_and_month(month.year_number, month.month_number)
-        return os.path.join(journal_dir, '%s%s.txt' % (year_and_month, infix))
+    When overwriting 2014-12.txt:
+        write new content to 2014-12.new.txt and fsync it
+        back up 2014-12.txt if another program has changed it
+        rename 2014-12.new.txt to 2014-12.txt
+        fsync the journal directory
 
-    old = get_filename('.old')
-    new = get_filename('.new')
-    filename = get_filename('')
+    The rename is atomic, so after a crash 2014-12.txt contains either the
+    old or the new content. If durable is False, we skip the fsync calls.
+    They are needed to make sure the new content has reached the disk.
+    """
+    old = get_month_path(journal_dir, month, '.old')
+    new = get_month_path(journal_dir, month, '.new')
+    filename = get_month_path(journal_dir, month)
 
     # Do not save empty month files.
     if not content and not os.path.exists(filename):
-        return False
+        return None
 
     with codecs.open(new, 'wb', encoding='utf-8') as f:
         # Write readable unicode and no Python directives.
         yaml.dump(content, f, Dumper=Dumper, allow_unicode=True)
+        if durable:
+            f.flush()
+            os.fsync(f.fileno())
+
+    try:
+        # Make file readable and writable only by the owner.
+        os.chmod(new, stat.S_IRUSR | stat.S_IWUSR)
+    except OSError:
+        pass
 
     if os.path.exists(filename):
         mtime = os.path.getmtime(filename)
         if mtime != month.mtime:
-            conflict = get_filename('.CONFLICT_BACKUP' + str(mtime))
+            conflict = get_month_path(journal_dir, month, '.CONFLICT_BACKUP' + str(mtime))
             logging.debug('Last edit time of %s conflicts with edit time at file load\n'
                           '--> Backing up to %s' % (filename, conflict))
             shutil.copy2(filename, conflict)
-        shutil.copy2(filename, old)
-    shutil.move(new, filename)
+        if sys.platform == 'win32':
+            # os.rename() cannot overwrite files on Windows.
+            os.rename(filename, old)
+    os.rename(new, filename)
     if os.path.exists(old):
         os.remove(old)
+    if durable:
+        _fsync_dir(journal_dir)
 
-    try:
-        # Make file readable and writable only by the owner.
-        os.chmod(filename, stat.S_IRUSR | stat.S_IWUSR)
-    except OSError:
-        pass
-
-    month.edited = False
     month.mtime = os.path.getmtime(filename)
     logging.info('Wrote file %s' % filename)
-    return True
+    return filename
+
+
+def write_snapshots(snapshots, journal_dir, change_log=None, durable=True):
+    '''
+    Write the snapshots to their month files and return a list of
+    (filename, content, mtime) triples for the written files.
+
+    Afterwards, the month files contain all changes from the change log,
+    so it is cleared.
+    '''
+    written = []
+    for month, content in snapshots:
+        filename = _write_month_to_disk(month, content, journal_dir, durable)
+        if filename:
+            written.append((filename, content, month.mtime))
+    if change_log:
+        change_log.clear()
+    return written
+
+
+def update_cache(cache, written):
+    '''Store the written month files (see write_snapshots) in the cache.'''
+    for filename, content, mtime in written:
+        cache.set(filename, content, mtime)
+    cache.save()
 
 
-def save_months_to_disk(months, journal_dir, exit_imminent=False, saveas=False):
+def save_months_to_disk(months, journal_dir, exit_imminent=False, saveas=False,
+                        cache=None, change_log=None, durable=True):
     '''
     Update the journal on disk and return if something had to be written.
+
+    The written months are also stored in the given MonthCache.
     '''
-    something_saved = False
-    for year_and_month, month in months.items():
-        # We always need to save everything when we are "saving as".
-        if month.edited or saveas:
-            something_saved |= _save_month_to_disk(month, journal_dir)
+    snapshots = take_snapshots(months, saveas)
+    try:
+        written = write_snapshots(snapshots, journal_dir, change_log, durable)
+    except (IOError, OSError):
+        mark_unsaved(snapshots)
+        raise
+
+    if cache:
+        update_cache(cache, written)
+    return bool(written)
+
+
+class JournalWriter(object):
+    '''
+    Write month files and change log records in a background thread.
+
+    Jobs run one after another in the order they have been submitted, so
+    a month file is never written by two jobs at once and the mtime of the
+    last write is known when the next job checks for conflicts. The main
+    thread only passes snapshots of the content to write.
+
+    When a job is done, its callback receives the result and the raised
+    exception (or None) through "schedule", e.g. gobject.idle_add, which
+    runs the callback in the main thread.
+    '''
+    def __init__(self, schedule):
+        self.schedule = schedule
+        self.jobs = Queue.Queue()
+        self.thread = threading.Thread(target=self._run, name='JournalWriter')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            function, args, callback = self.jobs.get()
+            result = error = None
+            try:
+                result = function(*args)
+            except Exception as error:
+                logging.error('Error while writing the journal: %s' % error)
+            if callback:
+                self.schedule(callback, result, error)
+            self.jobs.task_done()
+
+    def submit(self, function, args, callback=None):
+        self.jobs.put((function, args, callback))
 
-    return something_saved
+    def wait(self):
+        '''Block until all submitted jobs are done.'''
+        self.jobs.join()
@@ -19,38 +19,61 @@
 
 from __future__ import division
 
+from rednotebook.util import dates
+
+
+class MonthStatistics(object):
+    '''Aggregated numbers of the edited days of a month.'''
+    def __init__(self, days):
+        days = sorted(day for day in days if not day.empty)
+        self.words = sum(day.get_number_of_words() for day in days)
+        self.chars = sum(len(day.text) for day in days)
+        self.edited_days = len(days)
+        self.first_date = days[0].date if days else None
+        self.last_date = days[-1].date if days else None
+
 
 class Statistics(object):
+    '''
+    The numbers for the whole journal are sums of per-month aggregates. The
+    aggregates are cached until one of the month's days changes.
+    '''
     def __init__(self, journal):
         self.journal = journal
+        self.month_stats = {}
+
+    def invalidate(self, date):
+        self.month_stats.pop(dates.get_year_and_month_from_date(date), None)
+
+    def _get_month_stats(self):
+        month_stats = []
+        for year_and_month, month in self.journal.months.items():
+            if year_and_month not in self.month_stats:
+                self.month_stats[year_and_month] = MonthStatistics(month.days.values())
+            if self.month_stats[year_and_month].edited_days:
+                month_stats.append(self.month_stats[year_and_month])
+        return month_stats
 
     def get_number_of_words(self):
-        number_of_words = 0
-        for day in self.days:
-            number_of_words += day.get_number_of_words()
-        return number_of_words
+        return sum(stats.words for stats in self._get_month_stats())
 
     def get_number_of_distinct_words(self):
         return len(self.journal.get_word_count_dict())
 
     def get_number_of_chars(self):
-        number_of_chars = 0
-        for day in self.days:
-            number_of_chars += len(day.text)
-        return number_of_chars
+        return sum(stats.chars for stats in self._get_month_stats())
 
     def get_number_of_usage_days(self):
         '''Returns the timespan between the first and last entry'''
-        sorted_days = self.days
-        if len(sorted_days) <= 1:
-            return len(sorted_days)
-        first_day = sorted_days[0]
-        last_day = sorted_days[-1]
-        timespan = last_day.date - first_day.date
-        return abs(timespan.days) + 1
+        month_stats = self._get_month_stats()
+        if not month_stats:
+            return 0
+        first_date = min(stats.first_date for stats in month_stats)
+        last_date = max(stats.last_date for stats in month_stats)
+        return (last_date - first_date).days + 1
 
     def get_number_of_entries(self):
-        return len(self.days)
+        return sum(stats.edited_days for stats in self._get_month_stats())
 
     def get_edit_percentage(self):
         total = self.get_number_of_usage_days()
@@ -88,7 +111,6 @@ class Statistics(object):
 
     def show_dialog(self, dialog):
         self.journal.save_old_day()
-        self.days = self.journal.days
 
         day_store = dialog.day_list.get_model()
         day_store.clear()
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------
+# Copyright (c) 2009  Jendrik Seipp
+#
+# RedNotebook is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# RedNotebook is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with RedNotebook; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+# -----------------------------------------------------------------------
+
+import datetime
+import heapq
+import locale
+import logging
+import re
+
+from rednotebook.data import escape_tag
+from rednotebook.util import dates
+
+
+CLOUD_WORDS = 30
+
+# Number of days covered by the predefined cloud periods.
+CLOUD_PERIODS = {'week': 7, 'month': 30, 'year': 365}
+
+# Characters that make an entry of the ignore or include list a regex.
+REGEX_CHARS = re.compile(r'[.^$*+?{}\[\]\\|()]')
+# Inline flags like (?i) apply to the whole regex.
+INLINE_FLAGS = re.compile(r'\(\?[iLmsux]+\)')
+
+
+def get_regex(word):
+    try:
+        return re.compile(word + '$', re.I)
+    except Exception:
+        logging.warning('"%s" is not a valid regular expression' % word)
+        return None
+
+
+def compile_list(words):
+    '''
+    Split the words into a set of literal words and a list of regexes
+    matching all other words.
+
+    Each regex is compiled on its own first. Regexes without groups and
+    inline flags are combined into one, because otherwise numbered groups
+    and flags would change the meaning of the other regexes. We fall back
+    to the single regexes if the combination cannot be compiled.
+    '''
+    literals = set()
+    combinable = []
+    regexes = []
+    for word in words:
+        if not REGEX_CHARS.search(word):
+            literals.add(word.lower())
+            continue
+        regex = get_regex(word)
+        if regex is None:
+            continue
+        if regex.groups or INLINE_FLAGS.search(word):
+            regexes.append(regex)
+        else:
+            combinable.append((word, regex))
+    if len(combinable) > 1:
+        try:
+            return literals, [get_combined_regex(word for word, _regex in combinable)] + regexes
+        except Exception:
+            logging.warning('The cloud regexes could not be combined')
+    return literals, [compiled for _word, compiled in combinable] + regexes
+
+
+def get_combined_regex(words):
+    return re.compile(u'|'.join(u'(?:%s)$' % word for word in words), re.I)
+
+
+class WordFilter(object):
+    '''
+    Decide which words and tags appear in the clouds.
+
+    Literal words from the ignore and include lists are looked up in sets
+    and the other entries are matched with as few regexes as possible (see
+    compile_list). The verdict for each word is cached, so create a new
+    filter when the lists change.
+    '''
+    def __init__(self, ignore_list, include_list):
+        self.ignored_words, self.ignore_regexes = compile_list(ignore_list)
+        self.included_words, self.include_regexes = compile_list(include_list)
+        self.verdicts = {}
+
+    def _is_ignored(self, word):
+        return word.lower() in self.ignored_words or any(
+            regex.match(word) for regex in self.ignore_regexes)
+
+    def _is_included(self, word):
+        return word.lower() in self.included_words or any(
+            regex.match(word) for regex in self.include_regexes)
+
+    def shows_tag(self, tag):
+        return not self._is_ignored(tag)
+
+    def shows_word(self, word):
+        verdict = self.verdicts.get(word)
+        if verdict is None:
+            # Filter short words.
+            verdict = ((len(word) > 4 or self._is_included(word)) and
+                       not self._is_ignored(word))
+            self.verdicts[word] = verdict
+        return verdict
+
+
+def get_tag_counts(name_counts):
+    '''Map the hashtags of the tag names to the summed counts of the names.'''
+    counts = {}
+    for name, count in name_counts.items():
+        tag = u'#%s' % escape_tag(name)
+        counts[tag] = counts.get(tag, 0) + count
+    return counts
+
+
+def get_tags_for_cloud(tag_count_dict, word_filter):
+    return [(tag, freq) for (tag, freq) in tag_count_dict.items()
+            if word_filter.shows_tag(tag)]
+
+
+def get_words_for_cloud(word_counts, word_filter, number=CLOUD_WORDS):
+    '''
+    Return the most frequent of the given (word, frequency) pairs.
+    '''
+    words = ((word, freq) for (word, freq) in word_counts
+             if word_filter.shows_word(word))
+    return heapq.nlargest(number, words, key=lambda (word, freq): freq)
+
+
+def cmp_words((word1, _freq1), (word2, _freq2)):
+    # TODO: Use key=locale.strxfrm in python3
+    return locale.strcoll(word1, word2)
+
+
+def get_date_range(period, today=None):
+    '''
+    Return the start and end date of the cloud period. Besides "all" and
+    the predefined periods, the period can be a date range like
+    "2015-01-01..2015-06-30" where either date may be omitted. Missing
+    dates and invalid periods are returned as None.
+    '''
+    period = (period or '').strip().lower()
+    today = today or datetime.date.today()
+    if period in CLOUD_PERIODS:
+        return today - datetime.timedelta(days=CLOUD_PERIODS[period] - 1), today
+    if '..' not in period:
+        if period not in ('', 'all'):
+            logging.warning('"%s" is not a valid cloud period' % period)
+        return None, None
+    try:
+        return tuple(dates.get_date_from_date_string(date.strip()) if date.strip() else None
+                     for date in period.split('..', 1))
+    except ValueError:
+        logging.warning('"%s" is not a valid date range' % period)
+        return None, None
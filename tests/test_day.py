@@ -1,3 +1,6 @@
+# -*- coding: utf-8 -*-
+
+from rednotebook import data
 from rednotebook.data import Day, Month
 
 
@@ -44,3 +47,86 @@ def test_hashtags():
     assert day.hashtags == ['tag_with_longer_name']
     day.text = 'abc #tag def'
     assert day.hashtags == ['tag']
+
+
+def test_words():
+    month = Month(2000, 10)
+    day = Day(month, 20)
+    day.text = 'Some words, and (more) words #tag'
+    assert day.get_words() == ['Some', 'words', 'and', 'more', 'words', 'tag', 'tag']
+    assert day.get_number_of_words() == 7
+
+
+def test_tokenizers():
+    text = u"It's 東京都 time!"
+    vals = [
+        ('whitespace', [u"It's", u'東京都', u'time!']),
+        ('regex', [u"It's", u'東京都', u'time']),
+        ('cjk-bigram', [u"It's", u'東京', u'京都', u'time!']),
+    ]
+    for name, words in vals:
+        assert data.TOKENIZERS[name]().split(text) == words
+
+
+def test_cached_words():
+    month = Month(2000, 10)
+    day = Day(month, 20)
+    day.text = 'first words'
+    assert day.get_words() == ['first', 'words']
+    day.text = 'second words'
+    assert day.get_words() == ['second', 'words']
+    day.add_category_entry('Cat', 'entry')
+    assert day.get_words() == ['second', 'words', 'Cat', 'entry']
+    try:
+        data.set_tokenizer('regex')
+        day.text = 'some/words'
+        assert day.get_words(with_special_chars=True) == ['some', 'words', 'Cat', 'entry']
+    finally:
+        data.set_tokenizer()
+
+
+def test_cached_tags():
+    month = Month(2000, 10)
+    day = Day(month, 20)
+    day.text = '#First tag'
+    assert day.hashtags == ['first']
+    assert day.categories == ['first']
+    day.text = '#second tag'
+    assert day.categories == ['second']
+    day.add_category_entry('Cat', 'entry')
+    assert day.get_category_content_pairs() == {'second': [], 'Cat': ['entry']}
+    # Changing the returned values doesn't change the cached values.
+    day.get_category_content_pairs().clear()
+    day.get_category_content_pairs()['Cat'].append('other')
+    day.hashtags.append('third')
+    assert sorted(day.categories) == ['Cat', 'second']
+    assert day.get_category_content_pairs()['Cat'] == ['entry']
+    day.content = {'text': u''}
+    assert day.categories == []
+
+
+def test_copy():
+    month = Month(2000, 10)
+    day = Day(month, 20)
+    day.text = u'Rain #weather'
+    day.add_category_entry('Cat', 'entry')
+    copy = day.copy()
+    day.add_category_entry('Cat', 'other')
+    day.text = u'Sun'
+    assert copy.date == day.date
+    assert copy.text == u'Rain #weather'
+    assert copy.get_category_content_pairs() == {'weather': [], 'Cat': ['entry']}
+
+
+def test_casefolded_search():
+    month = Month(2000, 10)
+    day = Day(month, 20)
+    day.text = u'Die Straße ist lang'
+    # The original characters are highlighted.
+    assert u'STARTBOLDStraßeENDBOLD' in day.search_in_text(u'STRASSE')
+    assert u'STARTBOLDlangENDBOLD' in day.search_in_text(u'lang')
+    assert u'STARTBOLDStraße istENDBOLD' in day.search_in_text(u'strasse ist')
+    assert day.search_in_text(u'Weg') is None
+    day.add_category_entry(u'Orte', u'GROSSE Straße')
+    assert day.search_in_categories(u'grosse') == [u'GROSSE Straße']
+    assert data.casefold(u'ﬁ Σς') == u'fi σσ'
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+
+from rednotebook.data import Month
+from rednotebook.index import (
+    DayIndex, TagIndex, TextIndex, WordCounter, get_edit_distance, get_full_months, sum_counts)
+
+
+def get_dates(days):
+    return [str(day) for day in days]
+
+
+def test_day_index():
+    march = Month(2015, 3)
+    april = Month(2015, 4)
+    for month, day_number in [(march, 4), (march, 20), (april, 1)]:
+        month.get_day(day_number).text = u'Day %d' % day_number
+    # Empty days are ignored.
+    march.get_day(5)
+    day_index = DayIndex([april, march])
+    assert get_dates(day_index.days) == ['2015-03-04', '2015-03-20', '2015-04-01']
+
+    day = march.get_day(10)
+    day.text = u'New'
+    day_index.update(day)
+    assert get_dates(day_index.get_days_in_date_range(
+        datetime.date(2015, 3, 5), datetime.date(2015, 3, 31))) == ['2015-03-10', '2015-03-20']
+
+    march.get_day(4).text = u''
+    day_index.update(march.get_day(4))
+    assert get_dates(day_index.days) == ['2015-03-10', '2015-03-20', '2015-04-01']
+    assert day_index.get_days_in_date_range(
+        datetime.date(2016, 1, 1), datetime.date(2016, 1, 1)) == []
+
+
+def test_text_index():
+    month = Month(2015, 3)
+    month.get_day(4).text = u'Nice cream\nSpring'
+    month.get_day(5).text = u'Ice skating'
+    month.get_day(6).content = {'text': u'', 'Work': {u'Fixed bug': None}}
+    text_index = TextIndex(month.days.values())
+
+    def find(text):
+        return sorted(date.day for date in text_index.find(text))
+
+    assert find(u'ice') == [4, 5]
+    assert find(u'ICE CRE') == [4]
+    assert find(u'xice') == []
+    assert find(u'ed bu') == [6]
+    assert find(u'work') == [6]
+    assert find(u'2015-03-0') == [4, 5, 6]
+    # The index may return days that Query.matches() rejects later.
+    assert find(u'cream nice') == [4]
+
+    day = month.get_day(5)
+    day.text = u'Creamy'
+    text_index.update(day)
+    assert find(u'ice') == [4]
+    assert find(u'eamy') == [5]
+    day.text = u''
+    text_index.update(day)
+    assert find(u'eamy') == []
+    assert u'eam' in text_index.trigrams
+    assert u'amy' not in text_index.trigrams
+
+
+def test_tag_index():
+    month = Month(2015, 3)
+    month.get_day(4).content = {'text': u'#work #Home', 'Work': {u'Fixed bug': None}}
+    month.get_day(5).content = {'text': u'#home', 'Work': {u'Wrote tests': None}}
+    month.get_day(6).text = u'No tags'
+    tag_index = TagIndex(month.days.values())
+
+    def get_days(tags):
+        return [date.day for date in tag_index.get_dates(tags)]
+
+    assert sorted(tag_index.tags) == ['Work', 'home', 'work']
+    assert get_days(['home']) == [4, 5]
+    assert get_days(['home', 'work']) == [4, 5]
+    assert get_days(['work', 'missing']) == []
+    assert tag_index.get_entries('Work') == [u'Fixed bug', u'Wrote tests']
+    assert tag_index.get_entries('work') == []
+
+    day = month.get_day(4)
+    day.text = u''
+    tag_index.update(day)
+    assert get_days(['home']) == [5]
+    assert sorted(tag_index.tags) == ['Work', 'home']
+    assert tag_index.get_entries('Work') == [u'Fixed bug', u'Wrote tests']
+    day.content = {'text': u''}
+    tag_index.update(day)
+    assert tag_index.get_entries('Work') == [u'Wrote tests']
+
+
+def test_edit_distance():
+    assert get_edit_distance(u'receive', u'receive', 2) == 0
+    assert get_edit_distance(u'recieve', u'receive', 2) == 1
+    assert get_edit_distance(u'recive', u'receive', 2) == 1
+    assert get_edit_distance(u'rcv', u'receive', 2) == 3
+
+
+def test_variants():
+    month = Month(2015, 3)
+    month.get_day(4).text = u'I will receive a parcel at the café.'
+    month.get_day(5).text = u'Cafe au lait'
+    text_index = TextIndex(month.days.values())
+    assert text_index.get_variants(u'recieve') == []
+    assert text_index.get_variants(u'recieve', fuzzy=True) == [u'receive']
+    assert text_index.get_variants(u'cafe', ignore_accents=True) == [u'café']
+    assert text_index.get_variants(u'café', ignore_accents=True) == [u'cafe']
+
+    # Parts of words with diacritics are found, too.
+    month.get_day(6).text = u'Zwei Cafés und ein Crème brûlée'
+    text_index.update(month.get_day(6))
+    assert text_index.get_variants(u'cafe', ignore_accents=True) == [u'café']
+    assert text_index.get_variants(u'rul', ignore_accents=True) == [u'rûl']
+    assert text_index.get_variants(u'e', ignore_accents=True) == [u'è', u'é']
+
+    month.get_day(4).text = u''
+    month.get_day(6).text = u''
+    text_index.update(month.get_day(4))
+    text_index.update(month.get_day(6))
+    assert text_index.accented_words == {}
+    assert text_index.plain_trigrams == {}
+    assert text_index.get_variants(u'recieve', fuzzy=True) == []
+
+
+def test_word_counter():
+    month = Month(2015, 3)
+    day = month.get_day(4)
+    day.text = u'Rain rain sun'
+    month.get_day(5).text = u'Sun'
+    word_counter = WordCounter(month.days.values())
+    assert word_counter.counts == {u'rain': 2, u'sun': 2}
+
+    old_words = day.get_words()
+    day.text = u'Rain snow'
+    word_counter.replace(day.date, old_words, day.get_words())
+    assert word_counter.counts == {u'rain': 1, u'snow': 1, u'sun': 1}
+    word_counter.replace(day.date, day.get_words(), [])
+    assert word_counter.counts == {u'sun': 1}
+    assert word_counter.monthly_counts.months == {(2015, 3): {u'sun': 1}}
+
+
+def test_full_months():
+    date = datetime.date
+    assert get_full_months(date(2015, 1, 1), date(2015, 3, 31)) == ((2015, 1), (2015, 3))
+    assert get_full_months(date(2014, 12, 2), date(2016, 1, 30)) == ((2015, 1), (2015, 12))
+    assert get_full_months(date(2015, 3, 2), date(2015, 3, 30)) == ((2015, 4), (2015, 2))
+
+
+def test_counts_in_date_range():
+    months = []
+    for number, month_number in enumerate([1, 2, 3, 4], start=1):
+        month = Month(2015, month_number)
+        for day_number in [1, 15, 28]:
+            day = month.get_day(day_number)
+            day.text = u'word%d common' % number
+            day.content['Tag%d' % number] = {}
+        months.append(month)
+    day_index = DayIndex(months)
+    days = day_index.days
+    word_counter = WordCounter(days)
+    tag_index = TagIndex(days)
+
+    def get_counts(start_date, end_date):
+        return (word_counter.get_counts(day_index, start_date, end_date),
+                sum_counts(tag_index.get_name_count_parts(day_index, start_date, end_date)))
+
+    words, tags = get_counts(datetime.date(2015, 1, 15), datetime.date(2015, 3, 1))
+    assert words == {u'word1': 2, u'word2': 3, u'word3': 1, u'common': 6,
+                     u'tag1': 2, u'tag2': 3, u'tag3': 1}
+    assert tags == {u'Tag1': 2, u'Tag2': 3, u'Tag3': 1}
+    words, tags = get_counts(datetime.date(2015, 2, 2), datetime.date(2015, 2, 20))
+    assert words == {u'word2': 1, u'tag2': 1, u'common': 1}
+    assert tags == {u'Tag2': 1}
+
+    # The month counters are updated when days change.
+    day = days[-1]
+    old_words = day.get_words()
+    day.text = u''
+    day.content = {'text': u''}
+    word_counter.replace(day.date, old_words, day.get_words())
+    tag_index.update(day)
+    words, tags = get_counts(datetime.date(2015, 4, 1), datetime.date(2015, 4, 30))
+    assert words == {u'word4': 2, u'tag4': 2, u'common': 2}
+    assert tags == {u'Tag4': 2}
+
+
+def test_count_parts_do_not_change():
+    month = Month(2015, 3)
+    day = month.get_day(4)
+    day.text = u'Rain sun'
+    month.get_day(5).text = u'Sun'
+    word_counter = WordCounter(month.days.values())
+    day_index = DayIndex([month])
+    parts = word_counter.get_parts(day_index)
+    assert sum_counts(parts) == {u'rain': 1, u'sun': 2}
+
+    # The counters that have been handed out stay the same.
+    old_words = day.get_words()
+    day.text = u'Snow'
+    word_counter.replace(day.date, old_words, day.get_words())
+    assert sum_counts(parts) == {u'rain': 1, u'sun': 2}
+    assert sum_counts(word_counter.get_parts(day_index)) == {u'snow': 1, u'sun': 1}
+    parts = word_counter.get_parts(day_index, datetime.date(2015, 3, 1), datetime.date(2015, 3, 4))
+    assert sum_counts(parts) == {u'snow': 1}
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+
+from rednotebook.data import MAX_SNIPPETS, DaySnapshot, Month, compile_search_pattern
+from rednotebook.index import DayIndex, TagIndex, TextIndex
+from rednotebook.query import Plan, Tag, TagEntry, Text, parse_query, rank
+
+
+def test_parse_query():
+    query = parse_query(u'"ice cream" beach OR #Sea_Side -rain -#sick work:bug')
+    [phrase], [beach, sea_side], [work] = query.clauses
+    assert isinstance(phrase, Text) and phrase.text == u'ice cream'
+    assert isinstance(beach, Text) and beach.text == u'beach'
+    assert isinstance(sea_side, Tag) and sea_side.tag == u'sea_side'
+    assert isinstance(work, TagEntry) and (work.tag, work.entry) == (u'work', u'bug')
+    assert [unicode(atom) for atom in query.excluded] == [u'rain', u'#sick']
+    assert query.texts == [u'ice cream', u'beach']
+
+
+def test_parse_dates():
+    query = parse_query(u'after:2014 before:2015-03-10 in:2015-03')
+    assert query.start_date == datetime.date(2015, 3, 1)
+    assert query.end_date == datetime.date(2015, 3, 9)
+    assert not query.clauses
+    # Invalid dates are searched as text.
+    query = parse_query(u'in:2015-13')
+    assert query.start_date is None
+    assert [clause[0].raw for clause in query.clauses] == [u'in:2015-13']
+
+
+def test_parse_extreme_dates():
+    query = parse_query(u'before:0001')
+    assert (query.start_date, query.end_date) == (None, datetime.date.min)
+    assert unicode(query) == u'before:0001-01-02'
+    query = parse_query(u'after:9999')
+    assert (query.start_date, query.end_date) == (datetime.date.max, None)
+    assert unicode(query) == u'after:9999-12-30'
+    query = parse_query(u'in:0001')
+    assert (query.start_date, query.end_date) == (datetime.date.min, datetime.date(1, 12, 31))
+    assert unicode(query) == u'before:0002-01-01'
+    query = parse_query(u'in:9999-12-31')
+    assert query.start_date == query.end_date == datetime.date.max
+    assert unicode(query) == u'after:9999-12-30'
+    assert search(u'after:9999') == search(u'before:0001') == []
+    assert unicode(get_plan(u'in:0001')).splitlines()
+
+
+def get_plan(text):
+    months = [Month(2015, 3), Month(2015, 4)]
+    march, april = months
+    march.get_day(4).content = {'text': u'Ice cream at the beach #holiday', 'Work': {u'Fixed bug': None}}
+    march.get_day(5).content = {'text': u'Rain at the beach #holiday #sick'}
+    march.get_day(6).content = {'text': u'Rain', 'Work': {u'Wrote tests': None}}
+    april.get_day(1).content = {'text': u'Ice cream again #holiday'}
+    day_index = DayIndex(months)
+    return Plan(parse_query(text), day_index, TagIndex(day_index.days), TextIndex(day_index.days))
+
+
+def search(text):
+    plan = get_plan(text)
+    return [str(day) for day in plan.execute() if plan.query.matches(day)]
+
+
+def test_search():
+    assert search(u'ice') == ['2015-03-04', '2015-04-01']
+    assert search(u'"cream at"') == ['2015-03-04']
+    assert search(u'#holiday -#sick') == ['2015-03-04', '2015-04-01']
+    assert search(u'#holiday -rain in:2015-03') == ['2015-03-04']
+    assert search(u'tests OR #sick') == ['2015-03-05', '2015-03-06']
+    assert search(u'work:bug') == ['2015-03-04']
+    assert search(u'before:2015-03-05') == ['2015-03-04']
+    # Searching for "-" lists all days.
+    assert len(search(u'-')) == 4
+    # Unknown tags are searched as text.
+    assert search(u'http://example.com') == []
+
+
+def test_plan():
+    plan = get_plan(u'ice -#sick #holiday after:2015-03-04')
+    days = plan.execute()
+    assert [str(day) for day in days] == ['2015-04-01']
+    assert [description for description, count in plan.steps] == [
+        u'dates 2015-03-05 to end', u'#holiday', u'ice', u'-#sick']
+    assert unicode(plan).splitlines()[-1] == u'5. check each day for: after:2015-03-04 ice #holiday -#sick'
+    assert plan.query.get_results(days[0]) == ('2015-04-01', [(1, [u'STARTBOLDIceENDBOLD cream again ...'])])
+    # Days that only match the date filter show the start of their text.
+    plan = get_plan(u'in:2015-03-06')
+    assert plan.query.get_results(plan.execute()[0]) == ('2015-03-06', [(1, [u'Rain'])])
+
+
+def test_rank():
+    plan = get_plan(u'ice OR rain')
+    days = plan.execute()
+    today = datetime.date(2015, 4, 2)
+
+    def get_ranking(limit=None):
+        return [str(day) for day in rank(plan.query, days, limit, today)]
+
+    # More recent days win if the frequency is the same.
+    assert get_ranking() == ['2015-04-01', '2015-03-06', '2015-03-05', '2015-03-04']
+    assert get_ranking(limit=2) == ['2015-04-01', '2015-03-06']
+
+    march = days[0].month
+    march.get_day(4).text = u'Ice ice ice'
+    assert get_ranking(limit=1) == ['2015-03-04']
+    march.get_day(4).text = u'Sunshine'
+    assert '2015-03-04' not in get_ranking()
+
+
+def test_rank_snapshots():
+    for text in [u'ice OR rain', u'#holiday', u'work:bug', u'beach -#sick', u'2015-03']:
+        plan = get_plan(text)
+        days = plan.execute()
+        snapshots = [DaySnapshot(day) for day in days]
+        ranked_days = rank(plan.query, days)
+        assert [snapshot.date for snapshot in rank(plan.query, snapshots)] == [
+            day.date for day in ranked_days]
+
+    # Snapshots don't change when the days are edited.
+    day = days[0]
+    snapshot = DaySnapshot(day)
+    day.content = {'text': u'Snow', 'Work': {u'Other': None}}
+    assert snapshot.contains(u'ice') and not day.contains(u'ice')
+    assert snapshot.get_category_content_pairs() == {'Work': [u'Fixed bug'], u'holiday': []}
+
+
+def test_tag_entry_matches():
+    day = Month(2015, 3).get_day(4)
+    day.content = {'text': u'', u'Straßen Bau': {u'Große Straße': None}}
+    [[atom]] = parse_query(u'#straßen_bau:STRASSE').clauses
+    assert atom.folded_entry == u'strasse'
+    for searched_day in [day, DaySnapshot(day)]:
+        assert atom.matches(searched_day)
+        assert not TagEntry(u'Straßen Bau', u'Weg', u'').matches(searched_day)
+        assert not TagEntry(u'Bau', u'Straße', u'').matches(searched_day)
+
+
+def test_snippets():
+    month = Month(2015, 3)
+    day = month.get_day(4)
+    day.content = {'text': u' '.join([u'Rain'] * 30), 'Weather': {u'rain': None}}
+    count, snippets = day.find_in_text(compile_search_pattern(u'RAIN'), max_snippets=3)
+    assert count == 30
+    assert len(snippets) == 3
+    assert all(u'STARTBOLDRainENDBOLD' in snippet for snippet in snippets)
+
+    date_string, results = parse_query(u'rain').get_results(day)
+    assert [(number, len(texts)) for number, texts in results] == [(30, MAX_SNIPPETS), (1, 1)]
+    assert results[1] == (1, [u'rain'])
+
+
+def test_fuzzy_search():
+    plan = get_plan(u'craem')
+    assert plan.execute() == []
+    plan = get_plan(u'craem')
+    plan = Plan(plan.query, plan.day_index, plan.tag_index, plan.text_index, fuzzy=True)
+    assert [str(day) for day in plan.execute()] == ['2015-03-04', '2015-04-01']
+    assert plan.query.texts == [u'craem', u'cream']
+
+
+def test_accent_insensitive_search():
+    month = Month(2015, 3)
+    month.get_day(4).text = u'Zwei Cafés, bitte'
+    day_index = DayIndex([month])
+    text_index = TextIndex(day_index.days)
+    plan = Plan(parse_query(u'cafe'), day_index, TagIndex(day_index.days), text_index)
+    assert [day for day in plan.execute() if plan.query.matches(day)] == []
+    plan = Plan(parse_query(u'cafe'), day_index, TagIndex(day_index.days), text_index,
+                ignore_accents=True)
+    assert [str(day) for day in plan.execute() if plan.query.matches(day)] == ['2015-03-04']
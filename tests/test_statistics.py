@@ -0,0 +1,37 @@
+import datetime
+
+from rednotebook.data import Month
+from rednotebook.util.statistics import Statistics
+
+
+class Journal(object):
+    def __init__(self, months):
+        self.months = dict(('%d-%02d' % (month.year_number, month.month_number), month)
+                           for month in months)
+
+    def get_word_count_dict(self):
+        return {}
+
+
+def test_statistics():
+    march = Month(2015, 3)
+    march.get_day(4).text = u'Spring is coming'
+    march.get_day(20).text = u'Sun'
+    april = Month(2015, 4)
+    april.get_day(2).text = u'Rain'
+    april.get_day(3).text = u''
+    stats = Statistics(Journal([march, april]))
+
+    assert stats.get_number_of_words() == 5
+    assert stats.get_number_of_chars() == 23
+    assert stats.get_number_of_entries() == 3
+    assert stats.get_number_of_usage_days() == 30
+    assert sorted(stats.month_stats) == ['2015-03', '2015-04']
+
+    # Only the changed month is aggregated again.
+    april_stats = stats.month_stats['2015-04']
+    march.get_day(4).text = u''
+    stats.invalidate(datetime.date(2015, 3, 4))
+    assert stats.get_number_of_words() == 2
+    assert stats.get_number_of_usage_days() == 14
+    assert stats.month_stats['2015-04'] is april_stats
@@ -0,0 +1,341 @@
+import datetime
+import os
+import shutil
+import stat
+import sys
+import tempfile
+
+import pytest
+
+from rednotebook import storage
+from rednotebook.data import Month
+
+
+def write_month_file(data_dir, name, content):
+    with open(os.path.join(data_dir, name), 'w') as f:
+        f.write(content)
+
+
+def test_lazy_loading():
+    data_dir = tempfile.mkdtemp()
+    try:
+        write_month_file(data_dir, '2015-03.txt', '4: {text: Spring}\n')
+        write_month_file(data_dir, '2015-04.txt', '1: {text: Fool}\n')
+        months = storage.load_all_months_from_disk(data_dir, lazy=True)
+        assert sorted(months.keys()) == ['2015-03', '2015-04']
+        assert not any(month.loaded for month in months.values())
+
+        month = months['2015-03']
+        assert month.days[4].text == 'Spring'
+        assert month.loaded
+        assert not months['2015-04'].loaded
+        assert not month.edited
+    finally:
+        shutil.rmtree(data_dir)
+
+
+def test_eager_loading():
+    data_dir = tempfile.mkdtemp()
+    try:
+        write_month_file(data_dir, '2015-03.txt', '4: {text: Spring}\n')
+        months = storage.load_all_months_from_disk(data_dir)
+        assert months['2015-03'].loaded
+        assert months['2015-03'].days[4].text == 'Spring'
+    finally:
+        shutil.rmtree(data_dir)
+
+
+def test_parallel_loading():
+    data_dir = tempfile.mkdtemp()
+    try:
+        for month in range(1, 13):
+            write_month_file(data_dir, '2015-%02d.txt' % month, '%d: {text: Day %d}\n' % (month, month))
+        serial = storage.load_all_months_from_disk(data_dir, workers=1)
+        parallel = storage.load_all_months_from_disk(data_dir, workers=4)
+        assert sorted(serial.keys()) == sorted(parallel.keys())
+        for key, month in serial.items():
+            assert str(month) == str(parallel[key])
+            assert month.mtime == parallel[key].mtime
+    finally:
+        shutil.rmtree(data_dir)
+
+
+def test_corrupt_file_exits():
+    data_dir = tempfile.mkdtemp()
+    try:
+        write_month_file(data_dir, '2015-03.txt', '4: {text: Spring}\n')
+        write_month_file(data_dir, '2015-04.txt', '1: {text: [unclosed\n')
+        for workers in [1, 2]:
+            with pytest.raises(SystemExit):
+                storage.load_all_months_from_disk(data_dir, workers=workers)
+    finally:
+        shutil.rmtree(data_dir)
+
+
+def test_try_load_corrupt_file():
+    data_dir = tempfile.mkdtemp()
+    try:
+        write_month_file(data_dir, '2015-03.txt', '4: {text: Spring}\n')
+        write_month_file(data_dir, '2015-04.txt', '1: {text: [unclosed\n')
+        cache = storage.MonthCache(data_dir)
+        months = storage.load_all_months_from_disk(data_dir, lazy=True, cache=cache)
+        assert months['2015-03'].try_load()
+        assert months['2015-03'].days[4].text == 'Spring'
+        assert not months['2015-04'].try_load()
+        assert not months['2015-04'].loaded
+        assert cache.get(months['2015-03'].path)
+        assert not cache.get(months['2015-04'].path)
+    finally:
+        shutil.rmtree(data_dir)
+
+
+def test_cache():
+    data_dir = tempfile.mkdtemp()
+    try:
+        write_month_file(data_dir, '2015-03.txt', '4: {text: Spring}\n')
+        write_month_file(data_dir, '2015-04.txt', '1: {text: Fool}\n')
+        cache = storage.MonthCache(data_dir)
+        storage.load_all_months_from_disk(data_dir, cache=cache)
+        assert os.path.exists(cache.path)
+        if sys.platform != 'win32':
+            assert stat.S_IMODE(os.stat(cache.path).st_mode) == stat.S_IRUSR | stat.S_IWUSR
+
+        cache = storage.MonthCache(data_dir)
+        assert cache.get(os.path.join(data_dir, '2015-03.txt'))[0] == {4: {'text': 'Spring'}}
+        assert cache.verify() == []
+
+        # Changed files are parsed again.
+        write_month_file(data_dir, '2015-04.txt', '1: {text: Fools}\n')
+        assert cache.get(os.path.join(data_dir, '2015-04.txt')) is None
+        months = storage.load_all_months_from_disk(data_dir, cache=cache)
+        assert months['2015-04'].days[1].text == 'Fools'
+    finally:
+        shutil.rmtree(data_dir)
+
+
+def test_corrupt_cache():
+    data_dir = tempfile.mkdtemp()
+    try:
+        write_month_file(data_dir, '2015-03.txt', '4: {text: Spring}\n')
+        write_month_file(data_dir, storage.CACHE_FILENAME, 'garbage')
+        cache = storage.MonthCache(data_dir)
+        assert cache.entries == {}
+        months = storage.load_all_months_from_disk(data_dir, cache=cache)
+        assert months['2015-03'].days[4].text == 'Spring'
+        assert storage.MonthCache(data_dir).entries.keys() == ['2015-03.txt']
+    finally:
+        shutil.rmtree(data_dir)
+
+
+def test_change_log():
+    data_dir = tempfile.mkdtemp()
+    try:
+        month = Month(2015, 3)
+        month.get_day(4).text = u'Spring'
+        month.get_day(5).text = u'Rain'
+        month.edited = True
+        month.days[4].edited = True
+        months = {'2015-03': month}
+
+        change_log = storage.ChangeLog(data_dir)
+        change_log.append(storage.get_log_records(months))
+        assert not month.days[4].edited
+        if sys.platform != 'win32':
+            assert stat.S_IMODE(os.stat(change_log.path).st_mode) == stat.S_IRUSR | stat.S_IWUSR
+        assert storage.get_log_records(months) == []
+
+        # Skip records without day content and a record cut off by a crash.
+        with open(change_log.path, 'ab') as f:
+            f.write('{"date": "2015-03-06", "content": {"Tag": null}}\n')
+            f.write('{"date": "2015-03-06", "content": "text"}\n')
+            f.write('{"date": "2015-03-05", "cont')
+        records = change_log.read()
+        assert records == [(datetime.date(2015, 3, 4), {'text': u'Spring'})]
+
+        change_log.clear()
+        assert change_log.read() == []
+    finally:
+        shutil.rmtree(data_dir)
+
+
+def test_background_writer():
+    data_dir = tempfile.mkdtemp()
+    try:
+        month = Month(2015, 3)
+        month.get_day(4).text = u'Spring'
+        month.edited = True
+        months = {'2015-03': month}
+        results = []
+        writer = storage.JournalWriter(lambda callback, *args: callback(*args))
+
+        snapshots = storage.take_snapshots(months)
+        assert not month.edited
+        # Edits after the snapshot are not written.
+        month.get_day(4).text = u'Summer'
+        writer.submit(storage.write_snapshots, (snapshots, data_dir),
+                      lambda result, error: results.append((result, error)))
+        writer.wait()
+        [(written, error)] = results
+        assert error is None
+        [(filename, content, mtime)] = written
+        assert content == {4: {'text': u'Spring'}}
+        assert mtime == os.path.getmtime(filename) == month.mtime
+
+        # Files changed by other programs are backed up.
+        month.mtime -= 10
+        month.edited = True
+        storage.save_months_to_disk(months, data_dir)
+        backups = [name for name in os.listdir(data_dir) if 'CONFLICT_BACKUP' in name]
+        assert len(backups) == 1
+        assert storage.load_all_months_from_disk(data_dir)['2015-03'].days[4].text == 'Summer'
+    finally:
+        shutil.rmtree(data_dir)
+
+
+def save_day_text(data_dir, text, durable=True):
+    months = storage.load_all_months_from_disk(data_dir)
+    month = months['2015-03']
+    month.get_day(4).text = text
+    month.edited = True
+    storage.save_months_to_disk(months, data_dir, durable=durable)
+
+
+def read_day_text(data_dir):
+    return storage.load_all_months_from_disk(data_dir)['2015-03'].days[4].text
+
+
+class Crash(Exception):
+    pass
+
+
+def crash(*args, **kwargs):
+    raise Crash()
+
+
+def test_crash_while_writing(monkeypatch):
+    data_dir = tempfile.mkdtemp()
+    try:
+        write_month_file(data_dir, '2015-03.txt', '4: {text: Spring}\n')
+
+        def dump_partially(content, stream, **kwargs):
+            stream.write(u'4: {te')
+            raise Crash()
+
+        monkeypatch.setattr(storage.yaml, 'dump', dump_partially)
+        with pytest.raises(Crash):
+            save_day_text(data_dir, u'Summer')
+        monkeypatch.undo()
+        assert read_day_text(data_dir) == 'Spring'
+    finally:
+        shutil.rmtree(data_dir)
+
+
+def test_crash_before_rename(monkeypatch):
+    data_dir = tempfile.mkdtemp()
+    try:
+        write_month_file(data_dir, '2015-03.txt', '4: {text: Spring}\n')
+        monkeypatch.setattr(storage.os, 'rename', crash)
+        with pytest.raises(Crash):
+            save_day_text(data_dir, u'Summer')
+        monkeypatch.undo()
+        assert read_day_text(data_dir) == 'Spring'
+
+        # The leftover temporary file doesn't prevent saving.
+        save_day_text(data_dir, u'Autumn')
+        assert read_day_text(data_dir) == 'Autumn'
+        assert sorted(os.listdir(data_dir)) == ['2015-03.txt']
+    finally:
+        shutil.rmtree(data_dir)
+
+
+def test_sync_order(monkeypatch):
+    data_dir = tempfile.mkdtemp()
+    try:
+        write_month_file(data_dir, '2015-03.txt', '4: {text: Spring}\n')
+        calls = []
+        fsync, rename = os.fsync, os.rename
+
+        def logged_fsync(fd):
+            calls.append('fsync')
+            fsync(fd)
+
+        def logged_rename(src, dst):
+            calls.append('rename')
+            rename(src, dst)
+
+        monkeypatch.setattr(storage.os, 'fsync', logged_fsync)
+        monkeypatch.setattr(storage.os, 'rename', logged_rename)
+        save_day_text(data_dir, u'Summer')
+        assert calls == ['fsync', 'rename', 'fsync']
+
+        del calls[:]
+        save_day_text(data_dir, u'Autumn', durable=False)
+        assert calls == ['rename']
+        monkeypatch.undo()
+        assert read_day_text(data_dir) == 'Autumn'
+    finally:
+        shutil.rmtree(data_dir)
+
+
+def test_search_index_file():
+    data_dir = tempfile.mkdtemp()
+    try:
+        write_month_file(data_dir, '2015-03.txt', '4: {text: Spring}\n')
+        write_month_file(data_dir, '2015-04.txt', '1: {text: Fool}\n')
+        months = storage.load_all_months_from_disk(data_dir).values()
+        text_index = storage.load_text_index(months, storage.SearchIndexFile(data_dir))
+        index_file = storage.SearchIndexFile(data_dir)
+        storage.update_index_file(index_file, *storage.get_index_entries(text_index, months, index_file))
+
+        index_file = storage.SearchIndexFile(data_dir)
+        assert sorted(index_file.entries) == ['2015-03.txt', '2015-04.txt']
+        if sys.platform != 'win32':
+            assert stat.S_IMODE(os.stat(index_file.path).st_mode) == stat.S_IRUSR | stat.S_IWUSR
+        months = storage.load_all_months_from_disk(data_dir)
+        day_terms = index_file.get_terms(os.path.join(data_dir, '2015-03.txt'), months['2015-03'])
+        assert sorted(day_terms[4]) == [u'2015-03-04', u'spring']
+
+        # Changed files are indexed again.
+        write_month_file(data_dir, '2015-04.txt', '1: {text: Fools}\n')
+        months = storage.load_all_months_from_disk(data_dir)
+        assert index_file.get_terms(os.path.join(data_dir, '2015-04.txt'), months['2015-04']) is None
+        text_index = storage.load_text_index(months.values(), index_file)
+        assert text_index.find(u'fools') == set([datetime.date(2015, 4, 1)])
+        assert text_index.find(u'spring') == set([datetime.date(2015, 3, 4)])
+
+        # The journal can be read without the index.
+        write_month_file(data_dir, storage.INDEX_FILENAME, 'garbage')
+        text_index = storage.load_text_index(months.values(), storage.SearchIndexFile(data_dir))
+        assert text_index.find(u'fools') == set([datetime.date(2015, 4, 1)])
+    finally:
+        shutil.rmtree(data_dir)
+
+
+def test_update_index_file_after_writing():
+    data_dir = tempfile.mkdtemp()
+    try:
+        write_month_file(data_dir, '2015-03.txt', '4: {text: Spring}\n')
+        months = storage.load_all_months_from_disk(data_dir)
+        index_file = storage.SearchIndexFile(data_dir)
+        text_index = storage.load_text_index(months.values(), index_file)
+
+        month = months['2015-03']
+        day = month.get_day(4)
+        day.text = u'Summer'
+        text_index.update(day)
+        month.edited = True
+        snapshots = storage.take_snapshots(months)
+        day_terms = storage.get_day_terms(text_index, month)
+        assert sorted(day_terms[4]) == [u'2015-03-04', u'summer']
+
+        # The writer thread only gets the terms and the paths.
+        path = storage.get_month_path(data_dir, month)
+        written = storage.write_snapshots(snapshots, data_dir)
+        entries = [(filename, day_terms, mtime) for filename, content, mtime in written]
+        storage.update_index_file(index_file, entries, [path])
+
+        months = storage.load_all_months_from_disk(data_dir)
+        terms = storage.SearchIndexFile(data_dir).get_terms(path, months['2015-03'])
+        assert sorted(terms[4]) == [u'2015-03-04', u'summer']
+    finally:
+        shutil.rmtree(data_dir)
@@ -0,0 +1,64 @@
+import datetime
+
+from rednotebook.util import wordcloud
+from rednotebook.util.wordcloud import (
+    WordFilter, get_date_range, get_tag_counts, get_tags_for_cloud, get_words_for_cloud)
+
+
+def test_word_filter():
+    word_filter = WordFilter([u'Filter', u'#tags', u'bad.*', u'[invalid'], [u'mtv', u'a+'])
+    assert word_filter.ignored_words == set([u'filter', u'#tags'])
+    assert not word_filter.shows_word(u'filter')
+    assert not word_filter.shows_word(u'badger')
+    assert not word_filter.shows_word(u'tiny')
+    assert word_filter.shows_word(u'mtv')
+    assert word_filter.shows_word(u'aaa')
+    assert word_filter.shows_word(u'words')
+    assert word_filter.verdicts[u'badger'] is False
+    assert not word_filter.shows_tag(u'#tags')
+    assert word_filter.shows_tag(u'#work')
+
+
+def test_regexes_are_not_mixed():
+    # Groups and inline flags would change the meaning of other regexes.
+    word_filter = WordFilter([u'(ab)\\1', u'(?x) c d', u'e.+', u'f+g'], [])
+    assert len(word_filter.ignore_regexes) == 3
+    for word in [u'ababx', u'abab', u'cd', u'eeeee', u'ffffg']:
+        assert word_filter._is_ignored(word) == (word != u'ababx')
+    assert word_filter.shows_word(u'abcde')
+
+
+def test_regexes_that_cannot_be_combined(monkeypatch):
+    def fail(words):
+        raise Exception()
+    monkeypatch.setattr(wordcloud, 'get_combined_regex', fail)
+    word_filter = WordFilter([u'e.+', u'f+g'], [])
+    assert len(word_filter.ignore_regexes) == 2
+    assert not word_filter.shows_word(u'ffffg')
+    assert word_filter.shows_word(u'abcde')
+
+
+def test_words_for_cloud():
+    word_filter = WordFilter([u'ignored', u'#hidden'], [])
+    word_count_dict = dict((u'word%03d' % number, number) for number in range(100))
+    word_count_dict[u'ignored'] = 1000
+    words = get_words_for_cloud(word_count_dict.iteritems(), word_filter, number=3)
+    assert words == [(u'word099', 99), (u'word098', 98), (u'word097', 97)]
+    assert get_tags_for_cloud({u'#hidden': 1, u'#work': 2}, word_filter) == [(u'#work', 2)]
+
+
+def test_tag_counts():
+    assert get_tag_counts({u'Work': 2, u'work': 1, u'long tag': 3}) == {
+        u'#work': 3, u'#long_tag': 3}
+
+
+def test_date_range():
+    today = datetime.date(2015, 3, 10)
+    assert get_date_range('week', today) == (datetime.date(2015, 3, 4), today)
+    assert get_date_range(' Year ', today) == (datetime.date(2014, 3, 11), today)
+    assert get_date_range('all', today) == (None, None)
+    assert get_date_range('2015-01-01..2015-06-30', today) == (
+        datetime.date(2015, 1, 1), datetime.date(2015, 6, 30))
+    assert get_date_range('..2015-06-30', today) == (None, datetime.date(2015, 6, 30))
+    assert get_date_range('2015-13-01..', today) == (None, None)
+    assert get_date_range('fortnight', today) == (None, None)